@@ -0,0 +1,157 @@
+# app/admission.py
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import List, Optional, Tuple
+
+from app.config import (
+    ADMISSION_MAX_WAIT_S,
+    ADMISSION_QUEUE_SIZE,
+    MAX_ACTIVE_SESSIONS,
+    MAX_INFLIGHT_TURNS,
+)
+
+# All comments in English.
+
+# Never ask a client to stay away longer than this (seconds)
+MAX_RETRY_AFTER_S = 30
+
+
+class Priority(IntEnum):
+    """Lower value is served first."""
+    LIVE = 0  # a caller is on the line
+    PREWARM = 1  # background work that can wait or be shed
+
+
+def parse_priority(value: Optional[str]) -> Priority:
+    return Priority.PREWARM if (value or "").lower() == "prewarm" else Priority.LIVE
+
+
+class AdmissionRejected(Exception):
+    """The limiter is full; try again after `retry_after` seconds."""
+
+    def __init__(self, limiter: str, retry_after: int):
+        super().__init__(f"{limiter} at capacity, retry after {retry_after}s")
+        self.limiter = limiter
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """
+    Concurrency limit with a short, bounded, priority-ordered wait queue.
+    Requests that cannot get a slot within `max_wait_s` (or find the queue
+    full) are rejected right away instead of slowing everyone down.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, max_wait_s: float):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self.max_wait_s = max_wait_s
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        # Smoothed time a slot is held, used for the retry-after hint
+        self._avg_hold_s = 1.0
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def retry_after(self) -> int:
+        """Rough seconds until a slot frees up for a newcomer."""
+        backlog = self.waiting + 1
+        estimate = math.ceil(self._avg_hold_s * backlog / self.limit)
+        return min(MAX_RETRY_AFTER_S, max(1, estimate))
+
+    def _reject(self) -> AdmissionRejected:
+        self.rejected += 1
+        return AdmissionRejected(self.name, self.retry_after())
+
+    def _evict_lowest(self, priority: int) -> bool:
+        """Make room by rejecting the worst waiter if it ranks below `priority`."""
+        live = [w for w in self._waiters if not w[2].done()]
+        if not live:
+            return False
+        worst = max(live)
+        if worst[0] <= priority:
+            return False
+        worst[2].set_exception(self._reject())
+        self._waiters.remove(worst)
+        heapq.heapify(self._waiters)
+        return True
+
+    async def acquire(self, priority: Priority = Priority.LIVE) -> None:
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if self.waiting >= self.queue_size and not self._evict_lowest(priority):
+            raise self._reject()
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (int(priority), next(self._seq), fut)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.max_wait_s)
+        except asyncio.TimeoutError:
+            if fut.done():
+                fut.result()  # granted right at the deadline, or re-raise eviction
+                return
+            fut.cancel()
+            raise self._reject()
+        except asyncio.CancelledError:
+            # Caller went away while queued; hand the slot on if we got one
+            if fut.done() and not fut.cancelled() and not fut.exception():
+                self.release(0.0)
+            else:
+                fut.cancel()
+            raise
+
+    def release(self, held_s: Optional[float] = None) -> None:
+        if held_s is not None and held_s > 0:
+            self._avg_hold_s = 0.8 * self._avg_hold_s + 0.2 * held_s
+        self.active -= 1
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self.active += 1
+                self.admitted += 1
+                fut.set_result(None)
+                break
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.LIVE):
+        await self.acquire(priority)
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - t0)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "queueSize": self.queue_size,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avgHoldSeconds": round(self._avg_hold_s, 3),
+        }
+
+
+# One limiter for open calls, one for the expensive work inside them
+session_limiter = Limiter("sessions", MAX_ACTIVE_SESSIONS, ADMISSION_QUEUE_SIZE, ADMISSION_MAX_WAIT_S)
+turn_limiter = Limiter("turns", MAX_INFLIGHT_TURNS, ADMISSION_QUEUE_SIZE, ADMISSION_MAX_WAIT_S)
+
+
+def admission_stats() -> dict:
+    return {"sessions": session_limiter.stats(), "turns": turn_limiter.stats()}
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import av
+import numpy as np
+
+from app.config import AUDIO_DIR
+
+# All comments in English.
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    """One TTS output format a client can ask for."""
+    name: str
+    elevenlabs_format: str  # value for ElevenLabs' output_format query param
+    extension: str
+    media_type: str
+    # PyAV settings used when transcoding into this format
+    container: str
+    codec: str
+    sample_rate: int
+    bit_rate: Optional[int] = None
+
+
+AUDIO_FORMATS: Dict[str, AudioFormat] = {
+    f.name: f for f in [
+        AudioFormat("mp3", "mp3_44100_128", "mp3", "audio/mpeg", "mp3", "libmp3lame", 44100, 128_000),
+        AudioFormat("mp3_32", "mp3_22050_32", "mp3", "audio/mpeg", "mp3", "libmp3lame", 22050, 32_000),
+        AudioFormat("opus_32", "opus_48000_32", "opus", "audio/ogg", "ogg", "libopus", 48000, 32_000),
+        AudioFormat("opus_64", "opus_48000_64", "opus", "audio/ogg", "ogg", "libopus", 48000, 64_000),
+        AudioFormat("opus_96", "opus_48000_96", "opus", "audio/ogg", "ogg", "libopus", 48000, 96_000),
+        # Raw little-endian PCM16 mono for clients that stream into WebAudio
+        AudioFormat("pcm_16k", "pcm_16000", "pcm", "audio/L16;rate=16000", "s16le", "pcm_s16le", 16000),
+    ]
+}
+
+DEFAULT_FORMAT = "mp3"
+
+MEDIA_TYPES_BY_EXTENSION = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "ogg": "audio/ogg",
+    "pcm": "audio/L16;rate=16000",
+    "wav": "audio/wav",
+}
+
+# Files named after their content: "<prefix>_sha-<hash32>.<ext>" (TTS output)
+# or "variant_sha-<hash32>_<format>.<ext>" (transcodes of such a file). The
+# "sha-" marker keeps uuid-named files (generate_filename) from matching.
+CONTENT_ADDRESSED_RE = re.compile(r"_sha-(?P<digest>[0-9a-f]{32})(?:_[a-z0-9_]+)?\.[a-z0-9]+$")
+
+# Files still being written; renamed into place when complete, never served
+PARTIAL_EXTENSIONS = (".part", ".tmp")
+
+# (path, mtime_ns, size) -> sha256 hex, so repeat transcodes skip hashing
+_hash_cache: Dict[Tuple[str, int, int], str] = {}
+_transcode_lock = threading.Lock()
+
+
+def resolve_format(name: Optional[str]) -> AudioFormat:
+    """Return the requested format, falling back to the default for unknown names."""
+    return AUDIO_FORMATS.get(name or DEFAULT_FORMAT, AUDIO_FORMATS[DEFAULT_FORMAT])
+
+
+def media_type_for(filename: str) -> str:
+    ext = filename.rsplit(".", 1)[-1].lower()
+    return MEDIA_TYPES_BY_EXTENSION.get(ext, "application/octet-stream")
+
+
+def content_filename(prefix: str, digest: str, extension: str) -> str:
+    """Name for a write-once audio file whose content hashes to `digest`."""
+    return f"{prefix}_sha-{digest[:32]}.{extension}"
+
+
+def digest_from_filename(filename: str) -> Optional[str]:
+    """The content hash embedded in a content-addressed filename, if any."""
+    match = CONTENT_ADDRESSED_RE.search(filename)
+    return match.group("digest") if match else None
+
+
+def content_hash(path: str) -> str:
+    """sha256 of a file's content, memoized on (path, mtime, size)."""
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    digest = _hash_cache.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        _hash_cache[key] = digest
+    return digest
+
+
+def _decode_mono(path: str, sample_rate: int) -> np.ndarray:
+    """Decode any audio file (raw .pcm is PCM16 16 kHz) to mono int16 at sample_rate."""
+    if path.endswith(".pcm"):
+        with av.open(path, format="s16le", options={"sample_rate": "16000", "channels": "1"}) as src:
+            return _resample_stream(src, sample_rate)
+    with av.open(path) as src:
+        return _resample_stream(src, sample_rate)
+
+
+def _resample_stream(src, sample_rate: int) -> np.ndarray:
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=sample_rate)
+    chunks = []
+    for frame in src.decode(audio=0):
+        for out in resampler.resample(frame):
+            chunks.append(out.to_ndarray().reshape(-1))
+    for out in resampler.resample(None):
+        chunks.append(out.to_ndarray().reshape(-1))
+    if not chunks:
+        return np.zeros(0, dtype=np.int16)
+    return np.concatenate(chunks)
+
+
+def encode_pcm(samples: np.ndarray, sample_rate: int, fmt: AudioFormat, out_path: str) -> None:
+    """Encode mono int16 samples into fmt and write them to out_path."""
+    if fmt.codec == "pcm_s16le":
+        if sample_rate != fmt.sample_rate:
+            raise ValueError("Raw PCM output must already be at the target rate")
+        with open(out_path, "wb") as f:
+            f.write(samples.astype("<i2").tobytes())
+        return
+
+    with av.open(out_path, "w", format=fmt.container) as out:
+        stream = out.add_stream(fmt.codec, rate=fmt.sample_rate)
+        stream.layout = "mono"
+        if fmt.bit_rate:
+            stream.bit_rate = fmt.bit_rate
+        resampler = av.AudioResampler(
+            format=stream.codec_context.format.name, layout="mono", rate=fmt.sample_rate
+        )
+
+        frame = av.AudioFrame.from_ndarray(samples.reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = sample_rate
+        for resampled in resampler.resample(frame) + resampler.resample(None):
+            for packet in stream.encode(resampled):
+                out.mux(packet)
+        for packet in stream.encode(None):
+            out.mux(packet)
+
+
+def transcode_cached(filename: str, format_name: str) -> str:
+    """
+    Return the filename (inside AUDIO_DIR) of `filename` converted to
+    `format_name`. Variants are keyed by the source content hash, so each
+    distinct audio is transcoded at most once per format.
+    """
+    fmt = resolve_format(format_name)
+    src_path = os.path.join(AUDIO_DIR, filename)
+    # Content-addressed names carry their hash; only legacy names need a read
+    digest = digest_from_filename(filename) or content_hash(src_path)
+    variant = f"variant_sha-{digest[:32]}_{fmt.name}.{fmt.extension}"
+    variant_path = os.path.join(AUDIO_DIR, variant)
+
+    if os.path.exists(variant_path):
+        return variant
+
+    with _transcode_lock:
+        if not os.path.exists(variant_path):
+            samples = _decode_mono(src_path, fmt.sample_rate)
+            tmp_path = variant_path + ".tmp"
+            encode_pcm(samples, fmt.sample_rate, fmt, tmp_path)
+            os.replace(tmp_path, variant_path)
+            print(f"🎚️ Transcodificado {filename} → {variant}")
+    return variant
@@ -0,0 +1,79 @@
+# app/audio_serving.py
+import asyncio
+import os
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.audio_formats import (
+    AUDIO_FORMATS,
+    PARTIAL_EXTENSIONS,
+    digest_from_filename,
+    media_type_for,
+    transcode_cached,
+)
+
+# All comments in English.
+
+# Content-addressed files never change, so browsers may keep them forever
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# Legacy (uuid-named) files: cacheable, but revalidated with the ETag
+REVALIDATE_CACHE = "no-cache"
+
+
+class AudioFiles(StaticFiles):
+    """
+    Serves AUDIO_DIR with cache-friendly headers:
+    - strong ETag from the content hash in the filename (no file reads),
+    - Cache-Control: immutable for content-addressed files,
+    - 304 on If-None-Match / If-Modified-Since, Range requests and
+      pathsend (zero-copy on servers that support it) via FileResponse,
+    - ?format=opus_32 (etc.) serves a precompressed variant, transcoded
+      once per source file and format.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if path.endswith(PARTIAL_EXTENSIONS):
+            # Half-written TTS output or transcode: not there yet
+            raise HTTPException(status_code=404, detail="Audio not found")
+        query = parse_qs(scope.get("query_string", b"").decode())
+        requested = query.get("format", [None])[0]
+        if requested:
+            if requested not in AUDIO_FORMATS:
+                raise HTTPException(status_code=400, detail=f"Unknown audio format: {requested}")
+            full_path, stat_result = await asyncio.to_thread(self.lookup_path, path)
+            if stat_result is None:
+                raise HTTPException(status_code=404, detail="Audio not found")
+            path = await asyncio.to_thread(transcode_cached, os.path.basename(full_path), requested)
+        return await super().get_response(path, scope)
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        filename = os.path.basename(full_path)
+        headers = {}
+        if digest_from_filename(filename):
+            # The name (hash, plus format for variants) identifies the bytes
+            headers["etag"] = f'"{os.path.splitext(filename)[0]}"'
+            headers["cache-control"] = IMMUTABLE_CACHE
+        else:
+            headers["cache-control"] = REVALIDATE_CACHE
+
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            headers=headers,
+            media_type=media_type_for(filename),
+            stat_result=stat_result,
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
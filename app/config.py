@@ -11,13 +11,23 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY is not set in environment variables")
 
-genai.configure(api_key=GEMINI_API_KEY)
+# Optional override so the backend can talk to a local stub (bench/stub_servers.py)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+if GEMINI_API_ENDPOINT:
+    genai.configure(
+        api_key=GEMINI_API_KEY,
+        transport="rest",
+        client_options={"api_endpoint": GEMINI_API_ENDPOINT},
+    )
+else:
+    genai.configure(api_key=GEMINI_API_KEY)
 
 # ---------- ElevenLabs ----------
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID")
 if not ELEVENLABS_API_KEY or not ELEVENLABS_VOICE_ID:
     raise ValueError("ELEVENLABS_API_KEY or ELEVENLABS_VOICE_ID are not set")
+ELEVENLABS_API_BASE = os.getenv("ELEVENLABS_API_BASE", "https://api.elevenlabs.io")
 
 # ---------- App constants ----------
 BASE_PUBLIC_URL = os.getenv("BASE_PUBLIC_URL", "http://localhost:8000")
@@ -27,6 +37,41 @@ BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 AUDIO_DIR = os.path.join(BASE_DIR, "audio")
 os.makedirs(AUDIO_DIR, exist_ok=True)
 
+# Pre-synthesized TTS fragments: fixed phrases on disk per voice; name slots are
+# only kept in the bounded memory LRU (TTS_CACHE_SLOTS=0: not kept at all)
+TTS_FRAGMENT_DIR = os.getenv("TTS_FRAGMENT_DIR", os.path.join(BASE_DIR, "tts_fragments"))
+TTS_FRAGMENT_CACHE_ENTRIES = int(os.getenv("TTS_FRAGMENT_CACHE_ENTRIES", "256"))
+TTS_CACHE_SLOTS = os.getenv("TTS_CACHE_SLOTS", "1").lower() in ("1", "true", "yes")
+
+# How long a dropped /ws/voice session can be resumed with its token (seconds)
+SESSION_RESUME_GRACE_S = float(os.getenv("SESSION_RESUME_GRACE_S", "120"))
+
+# Admission control for /ws/voice and /intro
+MAX_ACTIVE_SESSIONS = int(os.getenv("MAX_ACTIVE_SESSIONS", "50"))
+MAX_INFLIGHT_TURNS = int(os.getenv("MAX_INFLIGHT_TURNS", str(os.cpu_count() or 4)))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "16"))
+ADMISSION_MAX_WAIT_S = float(os.getenv("ADMISSION_MAX_WAIT_S", "2.0"))
+
+# Replies kept for client retries of the same audio (seconds, entries)
+TURN_CACHE_TTL_S = float(os.getenv("TURN_CACHE_TTL_S", "60"))
+TURN_CACHE_MAX_ENTRIES = int(os.getenv("TURN_CACHE_MAX_ENTRIES", "1000"))
+
+# Turn profiling: share of turns sampled (0-1; sessions can opt in with
+# ?profile=1), sampling interval and how many profiles are kept on disk
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+
+# Token for the /admin endpoints (X-Admin-Token header); unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Write-behind persistence of turns and lead outcomes
+TURNS_TABLE = os.getenv("TURNS_TABLE", "ConversationTurn")
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "50"))
+PERSIST_FLUSH_INTERVAL_S = float(os.getenv("PERSIST_FLUSH_INTERVAL_S", "1.0"))
+PERSIST_MAX_PENDING = int(os.getenv("PERSIST_MAX_PENDING", "5000"))
+
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
 
@@ -1,37 +1,118 @@
+import hashlib
 import os
+from typing import Optional
+
 import requests
 
-from app.config import ELEVENLABS_API_KEY, ELEVENLABS_VOICE_ID, AUDIO_DIR, BASE_PUBLIC_URL
+from app.config import (
+    ELEVENLABS_API_KEY,
+    ELEVENLABS_API_BASE,
+    ELEVENLABS_VOICE_ID,
+    AUDIO_DIR,
+    BASE_PUBLIC_URL,
+)
+from app.audio_formats import content_filename, resolve_format
+from app.turn_control import CancelToken
 from app.utils import generate_filename, safe_str
 
 # All comments in English.
 
-def generate_tts(text: str, prefix: str = "tts") -> str:
+TTS_MODEL_ID = "eleven_turbo_v2"
+
+
+def generate_tts(
+    text: str,
+    prefix: str = "tts",
+    audio_format: str = "mp3",
+    cancel: Optional[CancelToken] = None,
+) -> str:
     """
-    Generate an MP3 file using ElevenLabs TTS and return a public URL
+    Generate an audio file using ElevenLabs TTS and return a public URL
     that can be used by the frontend (e.g. <audio src="...">).
+    `audio_format` is a key of app.audio_formats.AUDIO_FORMATS (default MP3).
+    With a cancel token the body is streamed and the connection is closed
+    as soon as the turn is cancelled.
+    The file is named after its content hash, so its URL can be cached forever.
     """
     text = safe_str(text)
-    filename = generate_filename(prefix=prefix, extension="mp3")
-    file_path = os.path.join(AUDIO_DIR, filename)
+    fmt = resolve_format(audio_format)
+    # Written under a temporary name, renamed once the hash is known
+    part_path = os.path.join(AUDIO_DIR, generate_filename(prefix=prefix, extension="part"))
+    hasher = hashlib.sha256()
 
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{ELEVENLABS_VOICE_ID}"
+    url = f"{ELEVENLABS_API_BASE}/v1/text-to-speech/{ELEVENLABS_VOICE_ID}"
 
     headers = {
         "xi-api-key": ELEVENLABS_API_KEY,
-        "Accept": "audio/mpeg",
+        "Accept": "audio/*",
         "Content-Type": "application/json",
     }
 
     payload = {
         "text": text,
-        "model_id": "eleven_turbo_v2",
+        "model_id": TTS_MODEL_ID,
     }
 
-    res = requests.post(url, json=payload, headers=headers)
+    if cancel:
+        # The streaming endpoint sends headers right away, so the socket can
+        # be closed mid-synthesis when the turn is cancelled.
+        cancel.enter("tts")
+        url += "/stream"
+
+    res = requests.post(
+        url,
+        json=payload,
+        headers=headers,
+        params={"output_format": fmt.elevenlabs_format},
+        stream=cancel is not None,
+    )
+    res.raise_for_status()
+
+    if cancel is None:
+        with open(part_path, "wb") as f:
+            f.write(res.content)
+        hasher.update(res.content)
+        return publish_audio(part_path, prefix, hasher.hexdigest(), fmt.extension)
+
+    cancel.add_closer(res.close)
+    try:
+        with open(part_path, "wb") as f:
+            for chunk in res.iter_content(chunk_size=16384):
+                cancel.check()
+                f.write(chunk)
+                hasher.update(chunk)
+        cancel.check()
+    except Exception:
+        # Partial audio is useless; a closed socket means we were cancelled
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        cancel.check()
+        raise
+    finally:
+        cancel.remove_closer(res.close)
+        res.close()
+
+    return publish_audio(part_path, prefix, hasher.hexdigest(), fmt.extension)
+
+
+def synthesize_pcm(text: str) -> bytes:
+    """Raw PCM16 mono 16 kHz for `text` (used for fragments that get stitched)."""
+    res = requests.post(
+        f"{ELEVENLABS_API_BASE}/v1/text-to-speech/{ELEVENLABS_VOICE_ID}",
+        json={"text": safe_str(text), "model_id": TTS_MODEL_ID},
+        headers={
+            "xi-api-key": ELEVENLABS_API_KEY,
+            "Accept": "audio/*",
+            "Content-Type": "application/json",
+        },
+        params={"output_format": "pcm_16000"},
+    )
     res.raise_for_status()
+    return res.content
 
-    with open(file_path, "wb") as f:
-        f.write(res.content)
 
+def publish_audio(part_path: str, prefix: str, digest: str, extension: str) -> str:
+    """Move a finished file to its content-addressed name and return its URL."""
+    filename = content_filename(prefix, digest, extension)
+    os.replace(part_path, os.path.join(AUDIO_DIR, filename))
     return f"{BASE_PUBLIC_URL}/audio/{filename}"
\ No newline at end of file
@@ -1,27 +1,134 @@
 import json
+import queue
 import re
-from typing import List, Dict
+import threading
+from concurrent.futures import CancelledError, Future
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Iterable, List, Dict, Optional, Tuple
 
+import numpy as np
 import google.generativeai as genai
-from faster_whisper import WhisperModel
+from google.generativeai import client as genai_client
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import TranscriptionOptions, get_suppressed_tokens
 
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import torch
 
 from app.models import Lead
+from app.phrases import CANNED_SENTENCES
+from app.resources import plan, pinned
+from app.stt_batching import WhisperBatcher
+from app.turn_control import CancelToken
+from app.vad import SAMPLE_RATE, voiced_span
 
 # -------------------------------------------------------------------
 # GLOBAL MODELS
 # -------------------------------------------------------------------
 
 # ---------- Faster Whisper (local STT) ----------
-whisper_model = WhisperModel(
-    "base",
-    device="cpu",
-    compute_type="int8"
+# Threads and concurrent transcriptions come from the CPU plan (app/resources.py);
+# loading pinned puts CTranslate2's compute threads on the Whisper cores
+with pinned("whisper", plan.whisper_cpus):
+    whisper_model = WhisperModel(
+        "base",
+        device="cpu",
+        compute_type="int8",
+        cpu_threads=plan.whisper_threads,
+        num_workers=plan.whisper_workers,
+    )
+
+# ---------- Cross-session STT batching ----------
+# Whisper's input window: longer clips take the sequential path, which splits them
+MAX_BATCH_CLIP_S = 30
+
+# Same decoding settings as the sequential path, minus Silero VAD and
+# temperature fallback (why batching is opt-in, see app/resources.py)
+STT_LANGUAGE = "es"
+STT_BEAM_SIZE = 5
+
+
+@lru_cache(maxsize=None)
+def _batch_setup() -> Tuple[BatchedInferencePipeline, Tokenizer, TranscriptionOptions]:
+    """Pipeline, tokenizer and options for batched decoding (built on first use)."""
+    pipeline = BatchedInferencePipeline(whisper_model)
+    tokenizer = Tokenizer(
+        whisper_model.hf_tokenizer,
+        whisper_model.model.is_multilingual,
+        task="transcribe",
+        language=STT_LANGUAGE,
+    )
+    options = TranscriptionOptions(
+        beam_size=STT_BEAM_SIZE,
+        best_of=5,
+        patience=1,
+        length_penalty=1,
+        repetition_penalty=1,
+        no_repeat_ngram_size=0,
+        log_prob_threshold=-1.0,
+        no_speech_threshold=0.6,
+        compression_ratio_threshold=2.4,
+        condition_on_previous_text=False,
+        prompt_reset_on_temperature=0.5,
+        temperatures=[0.0],
+        initial_prompt=None,
+        prefix=None,
+        suppress_blank=True,
+        suppress_tokens=get_suppressed_tokens(tokenizer, [-1]),
+        without_timestamps=False,
+        max_initial_timestamp=0.0,
+        word_timestamps=False,
+        prepend_punctuations="\"'“¿([{-",
+        append_punctuations="\"'.。,，!！?？:：”)]}、",
+        multilingual=False,
+        max_new_tokens=None,
+        clip_timestamps=[],
+        hallucination_silence_threshold=None,
+        hotwords=None,
+    )
+    return pipeline, tokenizer, options
+
+
+def transcribe_batch(clips: List[np.ndarray]) -> List[List[dict]]:
+    """
+    One Whisper pass over clips (<= 30 s, 16 kHz) from different turns:
+    a single encoder call and a single beam search over the whole batch.
+    BatchedInferencePipeline.transcribe only batches the chunks of one file,
+    so this feeds its forward() directly. Returns each clip's segments.
+    """
+    pipeline, tokenizer, options = _batch_setup()
+    extract = whisper_model.feature_extractor
+    features = np.stack([pad_or_trim(extract(clip)[..., :-1]) for clip in clips])
+    metadata = [{"offset": 0.0, "duration": len(clip) / SAMPLE_RATE} for clip in clips]
+    outputs = pipeline.forward(features, tokenizer, metadata, options)
+
+    # Drop silence the way the sequential decoder does
+    return [
+        [
+            seg for seg in segments
+            if not (seg["no_speech_prob"] > options.no_speech_threshold
+                    and seg["avg_logprob"] < options.log_prob_threshold)
+        ]
+        for segments in outputs
+    ]
+
+
+stt_batcher = (
+    WhisperBatcher(
+        transcribe_batch,
+        max_batch=plan.whisper_batch_size,
+        window_s=plan.whisper_batch_window_ms / 1000.0,
+        threads=plan.whisper_workers,
+    )
+    if plan.whisper_batch_size > 1
+    else None
 )
 
 # ---------- Local Intent Classifier (BETO Sentiment) ----------
+torch.set_num_threads(plan.classifier_threads)
 intent_tokenizer = AutoTokenizer.from_pretrained("finiteautomata/beto-sentiment-analysis")
 intent_model_fast = AutoModelForSequenceClassification.from_pretrained(
     "finiteautomata/beto-sentiment-analysis"
@@ -72,17 +179,55 @@ def classify_intent_fast(text: str) -> str:
 # -------------------------------------------------------------------
 # TRANSCRIBE + INTENT
 # -------------------------------------------------------------------
-def transcribe_and_analyze(file_path: str, mime_type: str = "audio/webm"):
+def transcribe(file_path: str, cancel: Optional[CancelToken] = None) -> str:
     """
-    Transcribe audio using Faster Whisper + classify intent locally.
+    Transcribe audio using Faster Whisper.
+    A cheap energy pre-VAD skips Whisper for silent uploads and trims
+    leading/trailing silence off the rest. Clips up to 30 s are decoded in
+    a batch with other turns' clips (stt_batcher); longer ones, or all of
+    them with WHISPER_BATCH_SIZE=1, decode lazily per segment, so a
+    cancelled turn stops at the next segment boundary.
     """
 
     print("🎤 Iniciando transcripción con Faster Whisper...")
+    if cancel:
+        cancel.enter("stt")
+
+    batch: Optional[Future] = None
+    with stt_batcher.preparing() if stt_batcher else nullcontext():
+        audio = decode_audio(file_path, sampling_rate=SAMPLE_RATE)
+        span = voiced_span(audio)
+        if span is None:
+            print(f"🔇 Audio sin voz ({len(audio) / SAMPLE_RATE:.2f}s), se omite Whisper")
+            return ""
+        offset = span[0] / SAMPLE_RATE
+        if span != (0, len(audio)):
+            print(f"✂️ Pre-VAD: {len(audio) / SAMPLE_RATE:.2f}s → {(span[1] - span[0]) / SAMPLE_RATE:.2f}s")
+            audio = audio[span[0]:span[1]]
+        if stt_batcher is not None and len(audio) <= MAX_BATCH_CLIP_S * SAMPLE_RATE:
+            batch = stt_batcher.submit(audio)
+
+    segments = wait_for_batch(batch, cancel) if batch is not None else transcribe_sequential(audio)
 
+    full_text = []
+    print("🔎 Segmentos detectados:")
+    for start, end, text in segments:
+        if cancel:
+            cancel.check()
+        print(f"  🟦 [{offset + start:.2f}s → {offset + end:.2f}s] {text}")
+        full_text.append(text)
+
+    transcript = " ".join(full_text).strip()
+    print("📝 TRANSCRIPCIÓN FINAL:", transcript or "<vacía>")
+    return transcript
+
+
+def transcribe_sequential(audio: np.ndarray) -> Iterable[Tuple[float, float, str]]:
+    """(start, end, text) per segment, decoded lazily by Whisper on its own."""
     segments, info = whisper_model.transcribe(
-        file_path,
-        language="es",
-        beam_size=5,
+        audio,
+        language=STT_LANGUAGE,
+        beam_size=STT_BEAM_SIZE,
         vad_filter=True,
         vad_parameters={"min_silence_duration_ms": 300},
     )
@@ -90,23 +235,50 @@ def transcribe_and_analyze(file_path: str, mime_type: str = "audio/webm"):
     print("🌎 Idioma detectado:", info.language)
     print("📊 Probabilidad idioma:", info.language_probability)
 
-    full_text = []
-    print("🔎 Segmentos detectados:")
-    for seg in segments:
-        print(f"  🟦 [{seg.start:.2f}s → {seg.end:.2f}s] {seg.text}")
-        full_text.append(seg.text)
+    return ((seg.start, seg.end, seg.text) for seg in segments)
+
+
+def wait_for_batch(batch: Future, cancel: Optional[CancelToken]) -> List[Tuple[float, float, str]]:
+    """(start, end, text) per segment once the clip's batch has run."""
+    if cancel:
+        # A barge-in pulls the clip out of the queue if its batch hasn't started
+        cancel.add_closer(batch.cancel)
+    try:
+        segments = batch.result()
+    except CancelledError:
+        if cancel:
+            cancel.check()
+        raise
+    finally:
+        if cancel:
+            cancel.remove_closer(batch.cancel)
+    return [(seg["start"], seg["end"], seg["text"]) for seg in segments]
 
-    transcript = " ".join(full_text).strip()
-    print("📝 TRANSCRIPCIÓN FINAL:", transcript or "<vacía>")
 
+def classify_intent(transcript: str, cancel: Optional[CancelToken] = None) -> str:
+    """Local intent for a finished transcript (NEUTRAL when nothing was said)."""
     if not transcript:
         print("⚠️ No se detectó texto. Intent = NEUTRAL")
-        return {"transcript": "", "intent": "NEUTRAL"}
+        return "NEUTRAL"
 
-    # ---------- LOCAL INTENT ----------
+    if cancel:
+        cancel.enter("intent")
     print("⚡ Clasificando intención localmente...")
     intent = classify_intent_fast(transcript)
     print("🔮 INTENCIÓN DETECTADA:", intent)
+    return intent
+
+
+def transcribe_and_analyze(
+    file_path: str,
+    mime_type: str = "audio/webm",
+    cancel: Optional[CancelToken] = None,
+):
+    """
+    Transcribe audio using Faster Whisper + classify intent locally.
+    """
+    transcript = transcribe(file_path, cancel=cancel)
+    intent = classify_intent(transcript, cancel=cancel)
 
     return {
         "transcript": transcript,
@@ -117,21 +289,10 @@ def transcribe_and_analyze(file_path: str, mime_type: str = "audio/webm"):
 # -------------------------------------------------------------------
 # BUILD RESPONSE (GEMINI — SHORT ANSWERS)
 # -------------------------------------------------------------------
-def build_response(
-    lead: Lead,
-    user_text: str,
-    intent: str,
-    history: List[Dict[str, str]],
-) -> str:
-
-    history_block = ""
-    for turn in history[-2:]:
-        history_block += f"Usuario: {turn.get('user')}\nAgente: {turn.get('agent')}\n\n"
-
-    print("🧵 HISTORY BLOCK SENT TO GEMINI:")
-    print(history_block or "[Sin mensajes previos]")
-
-    system_block = f"""
+def build_system_block(lead: Lead) -> str:
+    """Per-lead system prompt; it only depends on the lead, so sessions cache it."""
+    canned = "\n".join(f"- {sentence}" for sentence in CANNED_SENTENCES.values())
+    return f"""
 Eres un asesor comercial colombiano, profesional y cercano.
 Respuestas SIEMPRE cortas (máximo 3 oraciones, 12 palabras c/u).
 Nunca suenes robótico. Habla como vendedor experto.
@@ -165,9 +326,53 @@ Servicios:
 1) Premium: lavado + polichado + partes negras + 20 fotos (350k + IVA)
 2) Intermedia: lavado + 20 fotos (200k + IVA)
 3) Económica: solo fotos (100k + IVA)
+
+Frases fijas: cuando presentes un plan o el beneficio, usa la frase exacta,
+palabra por palabra (pueden pasar de 12 palabras):
+{canned}
 """
 
-    history_text = f"Historial breve:\n{history_block or '[Sin mensajes previos]'}\n"
+
+def build_prompt_prefix(
+    lead: Lead,
+    history: List[Dict[str, str]],
+    system_block: Optional[str] = None,
+    history_text: Optional[str] = None,
+) -> str:
+    """
+    The part of the prompt that does not depend on the new utterance
+    (system prompt + history), so it can be built while Whisper decodes.
+    `history_text` is the budgeted history from app.history_manager;
+    without it the last 2 turns are used verbatim.
+    """
+
+    if history_text is None:
+        history_block = ""
+        for turn in history[-2:]:
+            history_block += f"Usuario: {turn.get('user')}\nAgente: {turn.get('agent')}\n\n"
+        history_text = f"Historial breve:\n{history_block or '[Sin mensajes previos]'}\n"
+
+    print("🧵 HISTORY BLOCK SENT TO GEMINI:")
+    print(history_text)
+
+    if system_block is None:
+        system_block = build_system_block(lead)
+
+    return system_block + "\n" + history_text + "\n"
+
+
+def build_prompt(
+    lead: Lead,
+    user_text: str,
+    intent: str,
+    history: List[Dict[str, str]],
+    system_block: Optional[str] = None,
+    prompt_prefix: Optional[str] = None,
+) -> str:
+    """Assemble the full Gemini prompt for one turn (no model call)."""
+
+    if prompt_prefix is None:
+        prompt_prefix = build_prompt_prefix(lead, history, system_block)
 
     user_block = (
         f"Mensaje del cliente: \"{user_text}\"\n"
@@ -175,12 +380,106 @@ Servicios:
         "Responde con máximo 3 oraciones cortas."
     )
 
-    full_prompt = system_block + "\n" + history_text + "\n" + user_block
+    return prompt_prefix + user_block
+
+
+def prepare_reply_client() -> None:
+    """
+    Create Gemini's client ahead of the first request (the SDK does it lazily
+    inside generate_content), so a turn can do it while intent is classified.
+    """
+    if reply_model._client is None:
+        reply_model._client = genai_client.get_default_generative_client()
 
-    response = reply_model.generate_content(
-        full_prompt,
-    )
 
-    text = (response.text or "").strip()
+def build_response(
+    lead: Lead,
+    user_text: str,
+    intent: str,
+    history: List[Dict[str, str]],
+    system_block: Optional[str] = None,
+    cancel: Optional[CancelToken] = None,
+    prompt_prefix: Optional[str] = None,
+) -> str:
+
+    full_prompt = build_prompt(lead, user_text, intent, history, system_block, prompt_prefix)
+
+    if cancel is None:
+        response = reply_model.generate_content(
+            full_prompt,
+        )
+        text = (response.text or "").strip()
+        print("🤖 RESPUESTA GEMINI:", text)
+        return text
+
+    # Cancellable path: a helper thread reads the stream into a queue, so a
+    # barge-in wakes this thread at once (also while Gemini has not sent the
+    # first chunk yet) and the closer cancels the upstream HTTP stream.
+    cancel.enter("llm")
+    chunks: "queue.Queue" = queue.Queue()
+    upstream = []
+
+    def close_stream() -> None:
+        chunks.put(None)
+        for response in upstream:
+            stop = getattr(getattr(response, "_iterator", None), "cancel", None)
+            if stop is not None:
+                stop()
+
+    def read_stream() -> None:
+        try:
+            # Blocks until the first chunk arrives
+            response = reply_model.generate_content(full_prompt, stream=True)
+            upstream.append(response)
+            if cancel.cancelled:
+                close_stream()  # cancelled before the stream was reachable
+                return
+            for chunk in response:
+                chunks.put(chunk.text or "")
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(None)
+
+    cancel.add_closer(close_stream)
+    threading.Thread(target=read_stream, name="llm-stream", daemon=True).start()
+    parts = []
+    try:
+        while True:
+            item = chunks.get()
+            cancel.check()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            parts.append(item)
+    finally:
+        cancel.remove_closer(close_stream)
+
+    text = "".join(parts).strip()
     print("🤖 RESPUESTA GEMINI:", text)
-    return text
\ No newline at end of file
+    return text
+
+
+# -------------------------------------------------------------------
+# ROLLING SUMMARY (runs off the critical path)
+# -------------------------------------------------------------------
+def summarize_history(
+    previous_summary: str,
+    turns: List[Dict[str, str]],
+    max_words: int,
+) -> str:
+    """Fold older turns into the running call summary with Gemini."""
+    turns_text = "".join(
+        f"Usuario: {t.get('user')}\nAgente: {t.get('agent')}\n" for t in turns
+    )
+    prompt = (
+        "Actualiza el resumen de una llamada de ventas con los turnos nuevos.\n"
+        f"Máximo {max_words} palabras. Conserva datos concretos del cliente "
+        "(interés, objeciones, servicio, sede, fecha/hora acordada).\n\n"
+        f"Resumen actual:\n{previous_summary or '[vacío]'}\n\n"
+        f"Turnos nuevos:\n{turns_text}\n"
+        "Resumen actualizado:"
+    )
+    response = reply_model.generate_content(prompt)
+    return (response.text or "").strip()
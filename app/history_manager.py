@@ -0,0 +1,137 @@
+# app/history_manager.py
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List
+
+from app.gemini_service import summarize_history
+
+# All comments in English.
+
+# Settings are read here rather than in app.config so the microbenchmarks can
+# import this module without the API keys app.config requires.
+# Prompt history: total token budget, part of it reserved for the rolling summary
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "400"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "120"))
+# Background summary folds running at once (at most one per lead)
+HISTORY_SUMMARY_WORKERS = int(os.getenv("HISTORY_SUMMARY_WORKERS", "4"))
+
+# Rough chars-per-token for Spanish text; good enough to keep prompts bounded
+CHARS_PER_TOKEN = 4
+
+# Folds are mostly a Gemini round trip, so a few run at once: with a single
+# worker, many concurrent calls would queue up behind each other's folds.
+# Each lead has at most one fold pending (RollingSummary.running).
+_executor = ThreadPoolExecutor(
+    max_workers=max(1, HISTORY_SUMMARY_WORKERS), thread_name_prefix="history-summary"
+)
+_lock = threading.Lock()
+
+
+@dataclass
+class RollingSummary:
+    """Summary of a lead's turns [0, upto) plus whether a fold is running."""
+    text: str = ""
+    upto: int = 0
+    running: bool = False
+
+
+# Rolling summaries keyed by lead_key (same keys as conversation_store)
+_summaries: Dict[str, RollingSummary] = {}
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def format_turn(turn: Dict[str, str]) -> str:
+    return f"Usuario: {turn.get('user')}\nAgente: {turn.get('agent')}\n\n"
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Keep the end of `text` (the newest turns or facts) within `tokens`."""
+    max_chars = tokens * CHARS_PER_TOKEN
+    return text if len(text) <= max_chars else "…" + text[len(text) - max_chars + 1:].lstrip()
+
+
+def recent_start(history: List[Dict[str, str]]) -> int:
+    """
+    Index of the oldest turn that still fits verbatim in the budget left
+    after reserving room for the summary (the latest turn always fits).
+    """
+    remaining = HISTORY_TOKEN_BUDGET - HISTORY_SUMMARY_TOKENS
+    start = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        cost = estimate_tokens(format_turn(history[i]))
+        if cost > remaining and start < len(history):
+            break
+        remaining -= cost
+        start = i
+    return start
+
+
+def history_text(lead_key: str, history: List[Dict[str, str]]) -> str:
+    """
+    History block for the prompt: rolling summary of older turns, then the
+    most recent turns verbatim, within HISTORY_TOKEN_BUDGET tokens. Turns
+    that left the verbatim window but are not in the summary yet (their
+    fold is still running) stay verbatim, briefly going over the budget.
+    """
+    with _lock:
+        state = _summaries.get(lead_key, RollingSummary())
+        summary, upto = state.text, state.upto
+
+    start = recent_start(history)
+    recent = "".join(format_turn(t) for t in history[start:])
+    recent = truncate_to_tokens(recent, HISTORY_TOKEN_BUDGET - HISTORY_SUMMARY_TOKENS)
+    unsummarized = "".join(format_turn(t) for t in history[min(upto, start):start])
+    recent = unsummarized + recent
+
+    text = ""
+    if summary:
+        text += f"Resumen de la llamada hasta ahora:\n{summary}\n\n"
+    text += f"Historial breve:\n{recent or '[Sin mensajes previos]'}\n"
+    return text
+
+
+def schedule_summary(lead_key: str, history: List[Dict[str, str]]) -> None:
+    """
+    After a turn is stored: if turns fell out of the verbatim window, fold
+    them into the summary in the background (one fold per lead at a time).
+    """
+    with _lock:
+        state = _summaries.setdefault(lead_key, RollingSummary())
+        if state.running or recent_start(history) <= state.upto:
+            return
+        state.running = True
+    _executor.submit(_fold, lead_key, history)
+
+
+def _fold(lead_key: str, history: List[Dict[str, str]]) -> None:
+    with _lock:
+        state = _summaries[lead_key]
+        previous, upto = state.text, state.upto
+    snapshot = list(history)  # the live list keeps growing meanwhile
+    start = recent_start(snapshot)
+    turns = snapshot[upto:start]
+
+    try:
+        max_words = HISTORY_SUMMARY_TOKENS * CHARS_PER_TOKEN // 6
+        text = summarize_history(previous, turns, max_words)
+    except Exception as e:
+        # Keep the prompt bounded even without the LLM: plain, clipped turns
+        print("⚠️ Error resumiendo historial, usando resumen simple:", e)
+        text = (previous + " " + " ".join(f"Cliente: {t.get('user')}." for t in turns)).strip()
+        text = text[-HISTORY_SUMMARY_TOKENS * CHARS_PER_TOKEN:]  # newest facts win
+
+    with _lock:
+        state.text = truncate_to_tokens(text, HISTORY_SUMMARY_TOKENS)
+        state.upto = start
+        state.running = False
+    print(f"🗜️ Historial resumido para {lead_key}: {start} turnos en "
+          f"{estimate_tokens(state.text)} tokens")
+
+    # More turns may have overflowed while we were summarizing
+    schedule_summary(lead_key, history)
@@ -1,11 +1,24 @@
-import os
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import FileResponse, PlainTextResponse
+import asyncio
+import hmac
+import threading
+from typing import Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.database import get_lead_by_phone
-from app.elevenlabs_service import generate_tts
+from app.tts_fragments import assemble_tts, fragment_stats, intro_parts, parts_text, warm_phrases
+from app.gemini_service import stt_batcher
+from app.audio_formats import DEFAULT_FORMAT
+from app.audio_serving import AudioFiles
 
-from app.config import AUDIO_DIR
+from app.admission import AdmissionRejected, admission_stats, parse_priority, turn_limiter
+from app.config import ADMIN_TOKEN, AUDIO_DIR
+from app.persistence import writer as persistence_writer
+from app.profiling import list_profiles, profile_path
+from app.resources import allocation, pin_event_loop, report_allocation
+from app.turn_cache import turn_cache
+from app.turn_control import cancel_stats
 from app.ws_routes import router as ws_router
 
 # All comments in English.
@@ -23,6 +36,24 @@ app.add_middleware(
 # Register WebSocket routes
 app.include_router(ws_router, prefix="/ws")
 
+# ElevenLabs-generated audio for <audio src="...">, with ETag/Range/immutable caching
+app.mount("/audio", AudioFiles(directory=AUDIO_DIR), name="audio")
+
+
+@app.on_event("startup")
+def apply_cpu_plan():
+    """Pin the event loop (and the default executor it spawns) to the API cores."""
+    pin_event_loop()
+    report_allocation()
+    # Fixed TTS phrases for this voice; /intro synthesizes them on demand until then
+    threading.Thread(target=warm_phrases, name="tts-warmup", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def flush_pending_writes():
+    """Write queued turns and lead outcomes before the worker exits."""
+    persistence_writer.stop()
+
 
 @app.get("/health")
 def health():
@@ -30,36 +61,95 @@ def health():
     return {"status": "ok"}
 
 
-@app.get("/audio/{filename}")
-def get_audio(filename: str):
-    """
-    Serve ElevenLabs-generated audio files so the frontend
-    can play them via <audio src="...">.
-    """
-    file_path = os.path.join(AUDIO_DIR, filename)
-    if not os.path.exists(file_path):
-        return PlainTextResponse("Audio not found", status_code=404)
-    return FileResponse(file_path, media_type="audio/mpeg")
+@app.get("/debug/turns")
+def debug_turns():
+    """Turns abandoned by barge-in (by stage) and retries served from the turn cache."""
+    return {"cancellations": cancel_stats(), "retries": turn_cache.stats()}
+
+
+@app.get("/debug/admission")
+def debug_admission():
+    """Current load and rejections of the session and turn limiters."""
+    return admission_stats()
+
+
+@app.get("/debug/resources")
+def debug_resources():
+    """CPU budget split between Whisper, BETO and the API, and STT batching."""
+    return {**allocation(), "sttBatching": stt_batcher.stats() if stt_batcher else None}
+
+
+@app.get("/debug/tts")
+def debug_tts():
+    """Fragment cache hits and the characters billed vs saved by reusing phrases."""
+    return fragment_stats()
+
+
+@app.get("/debug/persistence")
+def debug_persistence():
+    """Write-behind queue depth and counters."""
+    return persistence_writer.stats()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints need X-Admin-Token; without ADMIN_TOKEN they don't exist."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+def admin_profiles():
+    """Saved turn profiles, newest first."""
+    return list_profiles()
+
+
+@app.get("/admin/profiles/{name}", dependencies=[Depends(require_admin)])
+def admin_profile(name: str):
+    """One profile as folded stacks (open it in speedscope or flamegraph.pl)."""
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
 
 @app.get("/intro")
-def intro(phone: str = Query(..., description="Lead phone number")):
+async def intro(
+    phone: str = Query(..., description="Lead phone number"),
+    format: str = Query(DEFAULT_FORMAT, description="TTS output format"),
+    priority: str = Query("live", description="'live' or 'prewarm'"),
+):
     """
     Generate an initial intro message TTS for a given phone number.
+    Shares the in-flight turn budget with /ws/voice; when it is full the
+    request fails fast with 503 and a Retry-After header.
     """
     # comments in English only
+    try:
+        async with turn_limiter.slot(parse_priority(priority)):
+            return await asyncio.to_thread(build_intro, phone, format)
+    except AdmissionRejected as e:
+        print(f"🚦 /intro rechazado: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, try again later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+def build_intro(phone: str, format: str) -> dict:
+    """Look up the lead and synthesize its intro (blocking; runs in a worker thread)."""
     try:
         lead = get_lead_by_phone(phone)
     except Exception:
         raise HTTPException(status_code=404, detail="Lead not found for this phone")
 
-    text = (
-        f"Hola {lead.name}, ¿cómo estás? Vi tu carro en TuCarro y quería contarte "
-        "que el 80% de nuestros clientes vende en menos de un mes y sin bajar el precio "
-        "gracias a nuestro lavado detallado y fotos profesionales. "
-        "¿Estás interesado en el servicio?"
-    )
+    # Fixed phrases come pre-synthesized; only the name goes to ElevenLabs
+    parts = intro_parts(lead.name)
+    text = parts_text(parts)
 
-    audio_url = generate_tts(text, prefix=f"intro_{lead.id}")
+    audio_url = assemble_tts(parts, prefix=f"intro_{lead.id}", audio_format=format)
 
     return {
         "text": text,
@@ -0,0 +1,205 @@
+# app/persistence.py
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.config import (
+    PERSIST_BATCH_SIZE,
+    PERSIST_FLUSH_INTERVAL_S,
+    PERSIST_MAX_PENDING,
+    TURNS_TABLE,
+    supabase_client,
+)
+from app.database import TABLE_NAME as LEAD_TABLE
+
+# All comments in English.
+
+# Longest wait between retries while the database is failing (seconds)
+MAX_BACKOFF_S = 30.0
+
+# Call outcome per last detected intent (anything else counts as contacted)
+OUTCOME_BY_INTENT = {
+    "INTERESTED": "INTERESTED",
+    "NOT_INTERESTED": "NOT_INTERESTED",
+    "FOLLOW_UP": "FOLLOW_UP",
+}
+
+
+class WriteBehind:
+    """
+    Buffers turn records and lead outcomes in memory and writes them from a
+    background thread: turns as one bulk insert, outcomes as one update per
+    (status, date) for all leads that share it. The voice path only appends
+    to a deque under a lock.
+    """
+
+    def __init__(
+        self,
+        client,
+        turns_table: str,
+        batch_size: int,
+        interval_s: float,
+        max_pending: int,
+    ):
+        self.client = client
+        self.turns_table = turns_table
+        self.batch_size = max(1, batch_size)
+        self.interval_s = interval_s
+        self.max_pending = max(self.batch_size, max_pending)
+
+        self._turns: Deque[Dict] = deque()
+        # lead_id -> latest outcome; a newer outcome replaces an unflushed one
+        self._outcomes: Dict[str, Dict] = {}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.written_turns = 0
+        self.written_outcomes = 0
+        self.dropped_turns = 0
+        self.failed_flushes = 0
+
+    # ---------- producer side (voice path) ----------
+    def enqueue_turn(self, record: Dict) -> None:
+        with self._cond:
+            if len(self._turns) >= self.max_pending:
+                # Bounded memory: the oldest unflushed turn goes first
+                self._turns.popleft()
+                self.dropped_turns += 1
+            self._turns.append(record)
+            if len(self._turns) >= self.batch_size:
+                self._cond.notify()
+        self._ensure_started()
+
+    def enqueue_outcome(self, lead_id: str, status: str) -> None:
+        with self._cond:
+            self._outcomes[lead_id] = {
+                "last_call_status": status,
+                "last_contact_at": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+            }
+        self._ensure_started()
+
+    # ---------- flusher thread ----------
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None and not self._stopping:
+                    self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        backoff = 0.0
+        while True:
+            with self._cond:
+                # Wake on a full batch, the flush interval, or shutdown;
+                # after a failed flush only the (growing) backoff counts
+                deadline = time.monotonic() + max(self.interval_s, backoff)
+                while not self._stopping and (backoff or len(self._turns) < self.batch_size):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                stopping = self._stopping
+            if self.flush():
+                backoff = 0.0
+            else:
+                backoff = min(MAX_BACKOFF_S, max(self.interval_s, backoff * 2))
+            if stopping:
+                return
+
+    def _take(self) -> Tuple[List[Dict], Dict[str, Dict]]:
+        with self._cond:
+            turns = [self._turns.popleft() for _ in range(min(len(self._turns), self.batch_size))]
+            outcomes, self._outcomes = self._outcomes, {}
+        return turns, outcomes
+
+    def _give_back(self, turns: List[Dict], outcomes: Dict[str, Dict]) -> None:
+        """Requeue a failed batch (newer outcomes for the same lead win)."""
+        with self._cond:
+            room = self.max_pending - len(self._turns)
+            keep = turns[len(turns) - room:] if room < len(turns) else turns
+            self.dropped_turns += len(turns) - len(keep)
+            self._turns.extendleft(reversed(keep))
+            for lead_id, outcome in outcomes.items():
+                self._outcomes.setdefault(lead_id, outcome)
+
+    def flush(self) -> bool:
+        """Write everything pending, in batches; False if the database failed."""
+        while True:
+            turns, outcomes = self._take()
+            if not turns and not outcomes:
+                return True
+            try:
+                if turns:
+                    self.client.table(self.turns_table).insert(turns).execute()
+                    self.written_turns += len(turns)
+                    turns = []  # written; never requeue them
+
+                # One UPDATE ... WHERE id IN (...) per distinct outcome
+                groups: Dict[Tuple, List[str]] = {}
+                for lead_id, outcome in outcomes.items():
+                    groups.setdefault(tuple(sorted(outcome.items())), []).append(lead_id)
+                for values, lead_ids in groups.items():
+                    self.client.table(LEAD_TABLE).update(dict(values)).in_("id", lead_ids).execute()
+                    self.written_outcomes += len(lead_ids)
+                    for lead_id in lead_ids:
+                        del outcomes[lead_id]
+            except Exception as e:
+                print("⚠️ Error guardando en la base de datos (se reintentará):", e)
+                self.failed_flushes += 1
+                self._give_back(turns, outcomes)
+                return False
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the flusher after a final flush (call on shutdown)."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        else:
+            self.flush()
+        stats = self.stats()
+        if stats["pendingTurns"] or stats["pendingOutcomes"]:
+            print(f"⚠️ Quedaron sin guardar {stats['pendingTurns']} turnos "
+                  f"y {stats['pendingOutcomes']} resultados de leads")
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending_turns = len(self._turns)
+            pending_outcomes = len(self._outcomes)
+        return {
+            "pendingTurns": pending_turns,
+            "pendingOutcomes": pending_outcomes,
+            "writtenTurns": self.written_turns,
+            "writtenOutcomes": self.written_outcomes,
+            "droppedTurns": self.dropped_turns,
+            "failedFlushes": self.failed_flushes,
+        }
+
+
+writer = WriteBehind(
+    supabase_client,
+    TURNS_TABLE,
+    PERSIST_BATCH_SIZE,
+    PERSIST_FLUSH_INTERVAL_S,
+    PERSIST_MAX_PENDING,
+)
+
+
+def record_turn(lead_id: str, user_text: str, agent_text: str, intent: str) -> None:
+    """Queue one conversation turn for the turns table (no I/O on the caller)."""
+    writer.enqueue_turn({
+        "lead_id": lead_id,
+        "user_text": user_text,
+        "agent_text": agent_text,
+        "intent": intent,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+
+
+def record_outcome(lead_id: str, last_intent: Optional[str]) -> None:
+    """Queue the lead's call outcome, derived from the last detected intent."""
+    writer.enqueue_outcome(lead_id, OUTCOME_BY_INTENT.get(last_intent or "", "CONTACTED"))
@@ -0,0 +1,17 @@
+# app/phrases.py
+
+# All comments in English.
+
+# Sentences the reply prompt tells Gemini to use word for word. They are
+# pre-synthesized by app/tts_fragments.py, so a reply that contains them is
+# billed only for the rest. Kept here, free of imports, because both
+# gemini_service (no app.config) and tts_fragments need them.
+CANNED_SENTENCES = {
+    "pitch_80": (
+        "El 80% de nuestros clientes vende en menos de un mes y sin bajar el precio "
+        "gracias a nuestro lavado detallado y fotos profesionales."
+    ),
+    "plan_premium": "El plan Premium incluye lavado, polichado, partes negras y 20 fotos por 350 mil más IVA.",
+    "plan_intermedia": "El plan Intermedia incluye lavado y 20 fotos por 200 mil más IVA.",
+    "plan_economica": "El plan Económica incluye solo fotos por 100 mil más IVA.",
+}
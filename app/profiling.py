@@ -0,0 +1,152 @@
+# app/profiling.py
+import contextvars
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.config import PROFILE_DIR, PROFILE_INTERVAL_MS, PROFILE_MAX_FILES, PROFILE_SAMPLE_RATE
+
+# All comments in English.
+
+# Deepest stack kept per sample (innermost frames win)
+MAX_DEPTH = 64
+
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+\.folded$")
+
+# Profiler of the turn running in this context (None: not profiled). The turn
+# sets it; run_stage copies the context into the worker threads.
+current_profile: contextvars.ContextVar[Optional["TurnProfiler"]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+class TurnProfiler:
+    """
+    Stack sampler for one turn: a background thread reads the stacks of the
+    threads currently running the turn's stages every PROFILE_INTERVAL_MS and
+    counts them. Unlike cProfile it works across concurrent stage threads,
+    and time spent in native code (Whisper, torch) shows up under the Python
+    frame that called it. Output is folded stacks ("stage;mod:func;... n"),
+    which speedscope and flamegraph.pl read directly.
+    """
+
+    def __init__(self, label: str, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.label = label
+        self.interval_s = interval_ms / 1000.0
+        self.samples: Counter = Counter()
+        # thread id -> (stage it is running, frames below the stage's code)
+        self._stages: Dict[int, Tuple[str, int]] = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="turn-profiler", daemon=True)
+        self._t0 = time.perf_counter()
+        self._suffix = ""
+        self._thread.start()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Sample the calling thread, under `name`, while the block runs."""
+        tid = threading.get_ident()
+        # Frames from the caller outwards (thread bootstrap, executor, the
+        # run_stage wrapper) are the same in every sample: leave them out
+        outer, frame = 0, sys._getframe(2)  # skip this generator and __enter__
+        while frame is not None:
+            outer, frame = outer + 1, frame.f_back
+        with self._lock:
+            self._stages[tid] = (name, outer)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stages.pop(tid, None)
+
+    def _sample(self) -> None:
+        with self._lock:
+            stages = dict(self._stages)
+        if not stages:
+            return
+        frames = sys._current_frames()
+        for tid, (stage, outer) in stages.items():
+            frame = frames.get(tid)
+            stack: List[str] = []  # innermost first
+            while frame is not None:
+                code = frame.f_code
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                stack.append(f"{module}:{code.co_name}")
+                frame = frame.f_back
+            stack = stack[: max(0, len(stack) - outer)][:MAX_DEPTH]
+            stack.append(stage)
+            self.samples[";".join(reversed(stack))] += 1
+
+    def _run(self) -> None:
+        while not self._done.wait(self.interval_s):
+            self._sample()
+        self._write()
+
+    def finish(self, outcome: str = "") -> None:
+        """Stop sampling; the file is written from the sampler thread."""
+        total_ms = (time.perf_counter() - self._t0) * 1000.0
+        self._suffix = f"{total_ms:.0f}ms" + (f"_{outcome}" if outcome else "")
+        self._done.set()
+
+    def _write(self) -> None:
+        if not self.samples:
+            return
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        name = re.sub(r"[^\w.-]", "_", f"{stamp}_{self.label}_{self._suffix}") + ".folded"
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(os.path.join(PROFILE_DIR, name), "w") as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            trim_profiles()
+            print(f"🔬 Perfil del turno guardado: {name}")
+        except OSError as e:
+            print("⚠️ No se pudo guardar el perfil del turno:", e)
+
+
+def maybe_profile(label: str, forced: bool = False) -> Optional[TurnProfiler]:
+    """A profiler when the session asked for one or the turn is sampled, else None."""
+    if forced or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE):
+        return TurnProfiler(label)
+    return None
+
+
+def list_profiles() -> List[dict]:
+    """Stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    entries = []
+    for entry in os.scandir(PROFILE_DIR):
+        if entry.is_file() and PROFILE_NAME_RE.match(entry.name):
+            stat = entry.stat()
+            entries.append({
+                "name": entry.name,
+                "bytes": stat.st_size,
+                "createdAt": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds"),
+            })
+    return sorted(entries, key=lambda e: e["name"], reverse=True)
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Path of a stored profile, or None (also for names outside the ring)."""
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def trim_profiles() -> None:
+    """Keep only the newest PROFILE_MAX_FILES profiles (names sort by time)."""
+    for entry in list_profiles()[max(1, PROFILE_MAX_FILES):]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, entry["name"]))
+        except OSError:
+            pass  # already trimmed by a concurrent writer
@@ -0,0 +1,237 @@
+# app/resources.py
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# All comments in English.
+
+# Settings are read here rather than in app.config: gemini_service and the
+# batch workers import this module without the API keys app.config requires.
+#
+#   CPU_BUDGET        cores this process may use (default: its CPU affinity)
+#   WHISPER_CORES     Whisper (CTranslate2) threads, split across WHISPER_WORKERS
+#   CLASSIFIER_CORES  torch intra-op threads for BETO
+#   API_CORES         event loop + I/O stages (LLM/TTS/DB calls)
+#   CPU_PINNING=1     also pin each group to its own cores (Linux only)
+#   WHISPER_BATCH_SIZE       clips from concurrent turns decoded together (1: off, default)
+#   WHISPER_BATCH_WINDOW_MS  how long a batch waits for more clips
+
+# CTranslate2 scales well up to ~4 threads per transcription; beyond that,
+# more concurrent transcriptions beat more threads per transcription
+THREADS_PER_WHISPER_WORKER = 4
+
+
+# Off by default: the batched decoder skips Whisper's Silero vad_filter and
+# temperature fallback (only the pre-VAD trim and the no-speech filter apply),
+# so it trades some accuracy on noisy or hard audio for throughput under load.
+# Batching adds no wait for a lone caller (see app/stt_batching.py).
+DEFAULT_WHISPER_BATCH_SIZE = 1
+DEFAULT_WHISPER_BATCH_WINDOW_MS = 20
+
+
+@dataclass(frozen=True)
+class CorePlan:
+    """Thread counts (and cores, when pinning) for each CPU consumer."""
+    budget: int
+    whisper_workers: int
+    whisper_threads: int  # per worker
+    classifier_threads: int
+    api_cores: int
+    pin: bool
+    whisper_cpus: Tuple[int, ...]
+    classifier_cpus: Tuple[int, ...]
+    api_cpus: Tuple[int, ...]
+    whisper_batch_size: int = 1
+    whisper_batch_window_ms: float = 0.0
+
+    @property
+    def oversubscribed(self) -> bool:
+        """True when the groups share cores (budget smaller than their sum)."""
+        used = self.whisper_workers * self.whisper_threads + self.classifier_threads + self.api_cores
+        return used > self.budget
+
+
+def available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan_cores(
+    budget: Optional[int] = None,
+    whisper: Optional[int] = None,
+    classifier: Optional[int] = None,
+    api: Optional[int] = None,
+    whisper_workers: Optional[int] = None,
+    pin: bool = False,
+    cores: Optional[List[int]] = None,
+    whisper_batch_size: int = 1,
+    whisper_batch_window_ms: float = 0.0,
+) -> CorePlan:
+    """
+    Split a core budget: a quarter for the API, an eighth for the classifier
+    (BETO is short), the rest for Whisper. Explicit counts win; on small
+    hosts every group still gets one thread and the groups share cores.
+    """
+    cores = cores or available_cores()
+    budget = max(1, min(budget or len(cores), len(cores)))
+
+    api = max(1, api or budget // 4)
+    classifier = max(1, classifier or budget // 8)
+    whisper = max(1, whisper or budget - api - classifier)
+    workers = max(1, whisper_workers or whisper // THREADS_PER_WHISPER_WORKER)
+    workers = min(workers, whisper)
+
+    # Consecutive cores per group, wrapping around when oversubscribed
+    pool = cores[:budget]
+    offset = 0
+
+    def take(n: int) -> Tuple[int, ...]:
+        nonlocal offset
+        picked = tuple(pool[(offset + i) % len(pool)] for i in range(min(n, len(pool))))
+        offset += n
+        return picked
+
+    return CorePlan(
+        budget=budget,
+        whisper_workers=workers,
+        whisper_threads=max(1, whisper // workers),
+        classifier_threads=classifier,
+        api_cores=api,
+        pin=pin,
+        whisper_cpus=take(whisper),
+        classifier_cpus=take(classifier),
+        api_cpus=take(api),
+        whisper_batch_size=max(1, whisper_batch_size),
+        whisper_batch_window_ms=whisper_batch_window_ms,
+    )
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def _env_int_or(name: str, default: int) -> int:
+    """Like _env_int, but an explicit 0 stays 0 instead of meaning "default"."""
+    value = _env_int(name)
+    return default if value is None else value
+
+
+plan = plan_cores(
+    budget=_env_int("CPU_BUDGET"),
+    whisper=_env_int("WHISPER_CORES"),
+    classifier=_env_int("CLASSIFIER_CORES"),
+    api=_env_int("API_CORES"),
+    whisper_workers=_env_int("WHISPER_WORKERS"),
+    pin=os.getenv("CPU_PINNING", "").lower() in ("1", "true", "yes"),
+    whisper_batch_size=_env_int_or("WHISPER_BATCH_SIZE", DEFAULT_WHISPER_BATCH_SIZE),
+    whisper_batch_window_ms=float(os.getenv("WHISPER_BATCH_WINDOW_MS", DEFAULT_WHISPER_BATCH_WINDOW_MS)),
+)
+
+
+def pin_current_thread(group: str, cpus: Tuple[int, ...]) -> None:
+    """
+    Pin the calling thread (threads it starts later inherit the mask).
+    Best effort: without sched_setaffinity the plan only sets thread counts.
+    """
+    if not plan.pin or not cpus:
+        return
+    try:
+        os.sched_setaffinity(0, cpus)  # 0 = calling thread on Linux
+    except (AttributeError, OSError) as e:
+        print(f"⚠️ No se pudo fijar la afinidad de CPU ({group}):", e)
+
+
+@contextmanager
+def pinned(group: str, cpus: Tuple[int, ...]):
+    """
+    Pin the calling thread for the block and restore its mask afterwards;
+    threads created inside keep the group's cores. The Whisper model is
+    loaded this way, since CTranslate2 starts its compute threads at load.
+    """
+    if not plan.pin or not cpus or not hasattr(os, "sched_getaffinity"):
+        yield
+        return
+    previous = os.sched_getaffinity(0)
+    pin_current_thread(group, cpus)
+    try:
+        yield
+    finally:
+        try:
+            os.sched_setaffinity(0, previous)
+        except OSError as e:
+            print(f"⚠️ No se pudo restaurar la afinidad de CPU ({group}):", e)
+
+
+def _pool(group: str, workers: int, cpus: Tuple[int, ...]) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=workers,
+        thread_name_prefix=group,
+        initializer=pin_current_thread,
+        initargs=(group, cpus),
+    )
+
+
+# Dedicated pools so STT and intent never queue behind LLM/TTS network waits
+# in the default executor (which stays with the event loop on the API cores).
+# With batching, STT threads mostly wait on their batch: one per batch slot.
+whisper_pool = _pool("whisper", plan.whisper_workers * plan.whisper_batch_size, plan.whisper_cpus)
+classifier_pool = _pool("classifier", 1, plan.classifier_cpus)
+
+STAGE_POOLS = {"stt": whisper_pool, "intent": classifier_pool}
+
+
+def stage_executor(stage: str) -> Optional[ThreadPoolExecutor]:
+    """Pool for a turn stage; None means the event loop's default executor."""
+    return STAGE_POOLS.get(stage)
+
+
+def pin_event_loop() -> None:
+    """Call from the event loop thread before it starts worker threads."""
+    pin_current_thread("api", plan.api_cpus)
+
+
+def allocation() -> dict:
+    """The effective allocation, as the libraries report it where possible."""
+    torch = sys.modules.get("torch")
+
+    def cpus(group_cpus: Tuple[int, ...]) -> List[int]:
+        return list(group_cpus) if plan.pin else []
+
+    return {
+        "budget": plan.budget,
+        "availableCores": len(available_cores()),
+        "oversubscribed": plan.oversubscribed,
+        "whisper": {
+            "workers": plan.whisper_workers,
+            "threadsPerWorker": plan.whisper_threads,
+            "batchSize": plan.whisper_batch_size,
+            "batchWindowMs": plan.whisper_batch_window_ms,
+            "cpus": cpus(plan.whisper_cpus),
+        },
+        "classifier": {
+            "threads": torch.get_num_threads() if torch else plan.classifier_threads,
+            "cpus": cpus(plan.classifier_cpus),
+        },
+        "api": {
+            "cores": plan.api_cores,
+            "cpus": cpus(plan.api_cpus),
+        },
+        "pinning": plan.pin,
+    }
+
+
+def report_allocation() -> None:
+    a = allocation()
+    print(
+        f"🧮 CPU: presupuesto={a['budget']}/{a['availableCores']} núcleos | "
+        f"Whisper={a['whisper']['workers']}×{a['whisper']['threadsPerWorker']} hilos"
+        f" (lotes de {a['whisper']['batchSize']}) | "
+        f"BETO={a['classifier']['threads']} hilos | API={a['api']['cores']} | "
+        f"afinidad={'sí' if a['pinning'] else 'no'}"
+        + (" | ⚠️ grupos comparten núcleos" if a["oversubscribed"] else "")
+    )
@@ -0,0 +1,80 @@
+# app/session_store.py
+import secrets
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from app.admission import Priority
+from app.audio_formats import DEFAULT_FORMAT
+from app.config import SESSION_RESUME_GRACE_S
+from app.models import Lead
+
+# All comments in English.
+
+
+@dataclass
+class VoiceSession:
+    """State of one call that outlives a single WebSocket connection."""
+    token: str
+    lead: Lead
+    lead_key: str
+    system_block: str
+    # Negotiated TTS output format (key of app.audio_formats.AUDIO_FORMATS)
+    audio_format: str = DEFAULT_FORMAT
+    # Admission priority for this call's turns (live callers first)
+    priority: Priority = Priority.LIVE
+    # Profile every turn of this call (?profile=1), not just sampled ones
+    profile: bool = False
+    # Intent of the latest turn, used as the call outcome
+    last_intent: Optional[str] = None
+    created_at: float = field(default_factory=time.monotonic)
+    # None while a socket is attached; monotonic time of the drop otherwise
+    detached_at: Optional[float] = None
+
+
+# In-memory session store keyed by resume token
+_sessions: Dict[str, VoiceSession] = {}
+
+
+def _purge_expired(now: float) -> None:
+    """Drop detached sessions whose grace window has passed."""
+    expired = [
+        token for token, s in _sessions.items()
+        if s.detached_at is not None and now - s.detached_at > SESSION_RESUME_GRACE_S
+    ]
+    for token in expired:
+        del _sessions[token]
+
+
+def create_session(lead: Lead, system_block: str) -> VoiceSession:
+    """Register a new call session and return it with a fresh resume token."""
+    _purge_expired(time.monotonic())
+    session = VoiceSession(
+        token=secrets.token_urlsafe(24),
+        lead=lead,
+        lead_key=str(lead.id),
+        system_block=system_block,
+    )
+    _sessions[session.token] = session
+    return session
+
+
+def resume_session(token: str) -> Optional[VoiceSession]:
+    """Reattach to a session by token, or None if unknown or expired."""
+    now = time.monotonic()
+    _purge_expired(now)
+    session = _sessions.get(token)
+    if session is None:
+        return None
+    session.detached_at = None
+    return session
+
+
+def detach_session(session: VoiceSession) -> None:
+    """Mark the session as disconnected; it can be resumed within the grace window."""
+    session.detached_at = time.monotonic()
+
+
+def end_session(session: VoiceSession) -> None:
+    """Forget the session immediately (call finished)."""
+    _sessions.pop(session.token, None)
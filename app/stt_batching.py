@@ -0,0 +1,119 @@
+# app/stt_batching.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Deque, List, Tuple
+
+import numpy as np
+
+# All comments in English.
+
+
+class WhisperBatcher:
+    """
+    Gathers clips from concurrent turns and runs them through Whisper as one
+    batch. STT threads call submit() and block on the returned future; each
+    of `threads` scheduler threads takes the first queued clip, waits up to
+    `window_s` for more (only while other turns are still decoding their
+    audio, so a lone caller never waits), and runs up to `max_batch` clips.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[np.ndarray]], List[list]],
+        max_batch: int,
+        window_s: float,
+        threads: int = 1,
+    ):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.window_s = window_s
+        self.threads = max(1, threads)
+
+        self._queue: Deque[Tuple[np.ndarray, Future]] = deque()
+        self._cond = threading.Condition()
+        # Turns between "started STT" and submit(): clips that may join soon
+        self._preparing = 0
+        self._started = False
+
+        self.batches = 0
+        self.clips = 0
+        self.largest_batch = 0
+
+    @contextmanager
+    def preparing(self):
+        """Wrap decoding/VAD so the scheduler knows another clip is coming."""
+        with self._cond:
+            self._preparing += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._preparing -= 1
+                self._cond.notify_all()
+
+    def submit(self, audio: np.ndarray) -> Future:
+        """Queue one clip (<= 30 s, 16 kHz mono); the future gets its segments."""
+        fut: Future = Future()
+        with self._cond:
+            self._queue.append((audio, fut))
+            self._cond.notify()
+        self._ensure_started()
+        return fut
+
+    def _ensure_started(self) -> None:
+        if self._started:
+            return
+        with self._cond:
+            if self._started:
+                return
+            for i in range(self.threads):
+                threading.Thread(target=self._run, name=f"whisper-batch-{i}", daemon=True).start()
+            self._started = True
+
+    def _take(self) -> List[Tuple[np.ndarray, Future]]:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = time.monotonic() + self.window_s
+            while len(self._queue) < self.max_batch and self._preparing > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self._queue), self.max_batch)
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take()
+            if not batch:
+                continue  # another scheduler thread took them
+            # Cancelled turns stopped waiting; don't spend Whisper on them
+            batch = [(audio, fut) for audio, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.run_batch([audio for audio, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), segments in zip(batch, results):
+                fut.set_result(segments)
+            with self._cond:
+                self.batches += 1
+                self.clips += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "batches": self.batches,
+                "clips": self.clips,
+                "avgBatch": round(self.clips / self.batches, 2) if self.batches else 0.0,
+                "largestBatch": self.largest_batch,
+            }
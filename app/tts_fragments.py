@@ -0,0 +1,279 @@
+# app/tts_fragments.py
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from app.audio_formats import encode_pcm, resolve_format
+from app.config import (
+    AUDIO_DIR,
+    ELEVENLABS_VOICE_ID,
+    TTS_CACHE_SLOTS,
+    TTS_FRAGMENT_CACHE_ENTRIES,
+    TTS_FRAGMENT_DIR,
+)
+from app.elevenlabs_service import TTS_MODEL_ID, generate_tts, publish_audio, synthesize_pcm
+from app.phrases import CANNED_SENTENCES
+from app.turn_control import CancelToken
+from app.utils import generate_filename
+from app.vad import RMS_FLOOR, frame_features
+
+# All comments in English.
+
+# Fragments are stored as raw PCM16 mono at this rate (ElevenLabs pcm_16000)
+FRAGMENT_RATE = 16000
+# Equal-power crossfade at each join, and silence kept at fragment edges
+CROSSFADE_MS = 12
+EDGE_PAD_MS = 60
+TRIM_FRAME_MS = 10
+
+# Fixed phrases, pre-synthesized once per voice
+INTRO_BODY = (
+    "¿cómo estás? Vi tu carro en TuCarro y quería contarte que el 80% de nuestros "
+    "clientes vende en menos de un mes y sin bajar el precio gracias a nuestro lavado "
+    "detallado y fotos profesionales. ¿Estás interesado en el servicio?"
+)
+PHRASES: Dict[str, str] = {
+    "greeting": "Hola",
+    "intro_body": INTRO_BODY,
+    # Reply sentences the prompt asks for verbatim (see app/phrases.py)
+    **CANNED_SENTENCES,
+}
+
+
+@dataclass(frozen=True)
+class Slot:
+    """Variable text synthesized per request (kept in memory by its text if `cache`)."""
+    text: str
+    cache: bool = TTS_CACHE_SLOTS
+
+
+Part = Union[str, Slot]
+
+
+def intro_parts(name: str) -> List[Part]:
+    """The /intro script: only the lead's name is synthesized per call."""
+    return [PHRASES["greeting"], Slot(f"{name},"), PHRASES["intro_body"]]
+
+
+def parts_text(parts: List[Part]) -> str:
+    return " ".join(p.text if isinstance(p, Slot) else p for p in parts)
+
+
+# -------------------------------------------------------------------
+# FRAGMENT STORE (memory LRU in front of a per-voice directory)
+# -------------------------------------------------------------------
+_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_lock = threading.Lock()
+_key_locks: Dict[str, threading.Lock] = {}
+
+stats = {"hits": 0, "synthesized": 0, "billedChars": 0, "savedChars": 0}
+
+
+def fragment_key(text: str) -> str:
+    """Fragments depend on the voice and the TTS model as well as the text."""
+    return hashlib.sha256(f"{ELEVENLABS_VOICE_ID}|{TTS_MODEL_ID}|{text}".encode()).hexdigest()[:32]
+
+
+def _fragment_path(key: str) -> str:
+    return os.path.join(TTS_FRAGMENT_DIR, ELEVENLABS_VOICE_ID, f"{key}.pcm")
+
+
+def _remember(key: str, samples: np.ndarray) -> None:
+    with _lock:
+        _cache[key] = samples
+        _cache.move_to_end(key)
+        while len(_cache) > max(1, TTS_FRAGMENT_CACHE_ENTRIES):
+            _cache.popitem(last=False)
+
+
+def fragment_pcm(text: str, cache: bool = True, persist: bool = True) -> np.ndarray:
+    """
+    PCM16 samples for `text`: memory, then disk, then ElevenLabs (billed).
+    Only `persist` fragments (the fixed phrases) are read from or written to
+    disk: slots are one per lead, and the directory has no eviction.
+    """
+    key = fragment_key(text)
+    with _lock:
+        samples = _cache.get(key)
+        if samples is not None:
+            _cache.move_to_end(key)
+            stats["hits"] += 1
+            stats["savedChars"] += len(text)
+            return samples
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # One synthesis per fragment even when several turns need it at once
+    with key_lock:
+        with _lock:
+            samples = _cache.get(key)
+        path = _fragment_path(key)
+        if samples is None and persist and os.path.exists(path):
+            samples = np.fromfile(path, dtype="<i2")
+        if samples is not None:
+            with _lock:
+                stats["hits"] += 1
+                stats["savedChars"] += len(text)
+        else:
+            pcm = synthesize_pcm(text)
+            samples = np.frombuffer(pcm[: len(pcm) // 2 * 2], dtype="<i2")
+            with _lock:
+                stats["synthesized"] += 1
+                stats["billedChars"] += len(text)
+            if cache and persist:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                samples.tofile(path + ".tmp")
+                os.replace(path + ".tmp", path)
+        if cache:
+            _remember(key, samples)
+    with _lock:
+        _key_locks.pop(key, None)
+    return samples
+
+
+def warm_phrases() -> None:
+    """Synthesize any missing fixed phrase for this voice (run at startup)."""
+    for name, text in PHRASES.items():
+        try:
+            fragment_pcm(text)
+        except Exception as e:
+            print(f"⚠️ No se pudo presintetizar la frase '{name}':", e)
+            return
+    print(f"🧩 Frases fijas de TTS listas para la voz {ELEVENLABS_VOICE_ID}")
+
+
+# -------------------------------------------------------------------
+# ASSEMBLY
+# -------------------------------------------------------------------
+def trim_silence(samples: np.ndarray, pad_ms: int = EDGE_PAD_MS) -> np.ndarray:
+    """Cut leading/trailing silence down to pad_ms, so joins sound like pauses."""
+    frame_len = FRAGMENT_RATE * TRIM_FRAME_MS // 1000
+    if len(samples) < frame_len:
+        return samples
+    rms, _ = frame_features(samples.astype(np.float32) / 32768.0, frame_len)
+    voiced = np.flatnonzero(rms >= RMS_FLOOR)
+    if len(voiced) == 0:
+        return samples
+    pad = FRAGMENT_RATE * pad_ms // 1000
+    start = max(0, voiced[0] * frame_len - pad)
+    end = min(len(samples), (voiced[-1] + 1) * frame_len + pad)
+    return samples[start:end]
+
+
+def crossfade_join(pieces: List[np.ndarray], fade_ms: int = CROSSFADE_MS) -> np.ndarray:
+    """Concatenate PCM16 pieces with an equal-power crossfade at each join."""
+    pieces = [p for p in pieces if len(p)]
+    if not pieces:
+        return np.zeros(0, dtype=np.int16)
+    fade = FRAGMENT_RATE * fade_ms // 1000
+    out = np.zeros(sum(len(p) for p in pieces), dtype=np.float32)
+
+    pos = 0
+    for i, piece in enumerate(pieces):
+        piece = piece.astype(np.float32)
+        n = min(fade, len(piece), pos) if i else 0
+        if n:
+            t = np.linspace(0.0, np.pi / 2, n, dtype=np.float32)
+            out[pos - n:pos] *= np.cos(t)
+            piece[:n] *= np.sin(t)
+            pos -= n
+        out[pos:pos + len(piece)] += piece
+        pos += len(piece)
+    return np.clip(out[:pos], -32768, 32767).astype(np.int16)
+
+
+def assemble_tts(
+    parts: List[Part],
+    prefix: str = "tts",
+    audio_format: str = "mp3",
+    cancel: Optional[CancelToken] = None,
+) -> str:
+    """
+    Like generate_tts, for text made of fixed phrases and slots: only slots
+    not seen before reach ElevenLabs (billed characters = those slots), and
+    the pieces are stitched locally into one file with a content-hash URL.
+    """
+    if cancel:
+        cancel.enter("tts")
+    pieces = []
+    for part in parts:
+        if cancel:
+            cancel.check()
+        if isinstance(part, Slot):
+            pieces.append(trim_silence(fragment_pcm(part.text, cache=part.cache, persist=False)))
+        else:
+            pieces.append(trim_silence(fragment_pcm(part)))
+    samples = crossfade_join(pieces)
+    if cancel:
+        cancel.check()
+
+    fmt = resolve_format(audio_format)
+    part_path = os.path.join(AUDIO_DIR, generate_filename(prefix=prefix, extension="part"))
+    encode_pcm(samples, FRAGMENT_RATE, fmt, part_path)
+    with open(part_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return publish_audio(part_path, prefix, digest, fmt.extension)
+
+
+# -------------------------------------------------------------------
+# FREE TEXT (LLM replies)
+# -------------------------------------------------------------------
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _normalize(sentence: str) -> str:
+    return re.sub(r"[^\w%]+", " ", sentence.lower()).strip()
+
+
+# The sentences the prompt asks the LLM to use verbatim
+_PHRASE_INDEX = {_normalize(text): text for text in CANNED_SENTENCES.values()}
+
+
+def reply_parts(text: str) -> Optional[List[Part]]:
+    """
+    Split a reply into library sentences and uncached slots (consecutive
+    free sentences stay one slot for natural prosody). Only sentences equal
+    to a library one (ignoring case and punctuation) are reused; None when
+    there is none, so the caller synthesizes the reply in one go.
+    """
+    parts: List[Part] = []
+    free: List[str] = []
+    matched = False
+    for sentence in (s.strip() for s in _SENTENCE_END_RE.split(text)):
+        if not sentence:
+            continue
+        phrase = _PHRASE_INDEX.get(_normalize(sentence))
+        if phrase is None:
+            free.append(sentence)
+            continue
+        matched = True
+        if free:
+            parts.append(Slot(" ".join(free), cache=False))
+            free = []
+        parts.append(phrase)
+    if free:
+        parts.append(Slot(" ".join(free), cache=False))
+    return parts if matched else None
+
+
+def generate_reply_tts(
+    text: str,
+    prefix: str = "tts",
+    audio_format: str = "mp3",
+    cancel: Optional[CancelToken] = None,
+) -> str:
+    """TTS for an LLM reply, reusing library sentences when the reply has any."""
+    parts = reply_parts(text)
+    if parts is None:
+        return generate_tts(text, prefix=prefix, audio_format=audio_format, cancel=cancel)
+    return assemble_tts(parts, prefix=prefix, audio_format=audio_format, cancel=cancel)
+
+
+def fragment_stats() -> dict:
+    with _lock:
+        return {**stats, "cached": len(_cache)}
@@ -0,0 +1,87 @@
+# app/turn_cache.py
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.config import TURN_CACHE_MAX_ENTRIES, TURN_CACHE_TTL_S
+from app.turn_control import TurnCancelled
+
+# All comments in English.
+
+TurnKey = Tuple[str, str]
+
+
+def turn_key(lead_key: str, audio_bytes: bytes) -> TurnKey:
+    """A turn is identified by who sent it and the exact audio bytes."""
+    return lead_key, hashlib.sha256(audio_bytes).hexdigest()
+
+
+class TurnCache:
+    """
+    Short-lived replies by TurnKey plus the futures of turns still running,
+    so a client retry (same bytes) reuses the original turn instead of
+    running STT → LLM → TTS again and appending a duplicate to the history.
+    Only used from the event loop thread.
+    """
+
+    def __init__(self, ttl_s: float, max_entries: int):
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self._results: "OrderedDict[TurnKey, Tuple[float, dict]]" = OrderedDict()
+        self._inflight: Dict[TurnKey, asyncio.Future] = {}
+        self.hits = 0
+        self.joined = 0
+
+    def get(self, key: TurnKey) -> Optional[dict]:
+        """Cached reply for a finished turn, if still fresh."""
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        expires_at, reply = entry
+        if time.monotonic() > expires_at:
+            del self._results[key]
+            return None
+        self.hits += 1
+        return reply
+
+    def inflight(self, key: TurnKey) -> Optional[asyncio.Future]:
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.joined += 1
+        return fut
+
+    def begin(self, key: TurnKey) -> None:
+        self._inflight[key] = asyncio.get_running_loop().create_future()
+
+    def finish(self, key: TurnKey, reply: dict) -> None:
+        """Store the reply and wake any retries waiting on this turn."""
+        self._results[key] = (time.monotonic() + self.ttl_s, reply)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+        fut = self._inflight.pop(key, None)
+        if fut is not None and not fut.done():
+            fut.set_result(reply)
+
+    def fail(self, key: TurnKey, error: BaseException) -> None:
+        """The turn produced no reply; waiting retries get the error, nothing is cached."""
+        fut = self._inflight.pop(key, None)
+        if fut is None or fut.done():
+            return
+        if isinstance(error, asyncio.CancelledError):
+            error = TurnCancelled("cancelled")
+        fut.set_exception(error)
+        fut.exception()  # mark as retrieved even if no retry is waiting
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._results),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "joined": self.joined,
+        }
+
+
+turn_cache = TurnCache(TURN_CACHE_TTL_S, TURN_CACHE_MAX_ENTRIES)
@@ -0,0 +1,81 @@
+# app/turn_control.py
+import threading
+from collections import Counter
+from typing import Callable, List, Optional
+
+# All comments in English.
+
+# How many turns were abandoned, keyed by the stage that was running
+cancel_counts: Counter = Counter()
+_counts_lock = threading.Lock()
+
+
+class TurnCancelled(Exception):
+    """Raised inside a stage when its turn was cancelled (barge-in)."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Turn cancelled during {stage}")
+        self.stage = stage
+
+
+class CancelToken:
+    """
+    Shared between the WebSocket loop and the worker threads of one turn.
+    Stages call check() at their yield points (between Whisper segments,
+    streamed LLM chunks and TTS body chunks) and register closers for
+    upstream connections so cancel() can drop them immediately.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._closers: List[Callable[[], None]] = []
+        self.stage: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def enter(self, stage: str) -> None:
+        """Mark the stage that is about to run (raises if already cancelled)."""
+        self.check()
+        self.stage = stage
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise TurnCancelled(self.stage or "queued")
+
+    def add_closer(self, closer: Callable[[], None]) -> None:
+        with self._lock:
+            if self._event.is_set():
+                closer()
+            else:
+                self._closers.append(closer)
+
+    def remove_closer(self, closer: Callable[[], None]) -> None:
+        with self._lock:
+            if closer in self._closers:
+                self._closers.remove(closer)
+
+    def cancel(self) -> bool:
+        """Cancel the turn once; returns False if it was already cancelled."""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self._event.set()
+            closers, self._closers = self._closers, []
+
+        with _counts_lock:
+            cancel_counts[self.stage or "queued"] += 1
+
+        for closer in closers:
+            try:
+                closer()
+            except Exception as e:
+                print("⚠️ Error cerrando conexión upstream:", e)
+        return True
+
+
+def cancel_stats() -> dict:
+    with _counts_lock:
+        return dict(cancel_counts)
@@ -1,4 +1,6 @@
+import io
 import re
+import wave
 from datetime import datetime
 import uuid
 
@@ -38,4 +40,15 @@ def safe_str(text: str) -> str:
     """Ensure text is a safe non-None string before sending to TTS."""
     if text is None:
         return ""
-    return str(text).strip()
\ No newline at end of file
+    return str(text).strip()
+
+
+def pcm16_to_wav_bytes(pcm: bytes, sample_rate: int = 16000) -> bytes:
+    """Wrap raw mono PCM16 little-endian samples in a WAV container."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return buf.getvalue()
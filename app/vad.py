@@ -0,0 +1,59 @@
+# app/vad.py
+from typing import Optional, Tuple
+
+import numpy as np
+
+# All comments in English.
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+
+# A frame is voiced when its RMS clears both an absolute floor (about -45 dBFS)
+# and a multiple of the recording's own noise floor, and it is not pure hiss
+RMS_FLOOR = 0.0056
+NOISE_RATIO = 3.0
+# ...but never demand more than about -30 dBFS (recordings with no pauses)
+RMS_CEILING = 0.03
+MAX_ZCR = 0.35
+
+# Less voiced audio than this is a click or a bump, not speech
+MIN_SPEECH_MS = 150
+# Context kept around the voiced span so Whisper sees word onsets/endings
+PAD_MS = 200
+
+
+def frame_features(audio: np.ndarray, frame_len: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-frame RMS energy and zero-crossing rate of float32 mono PCM."""
+    n_frames = len(audio) // frame_len
+    frames = audio[: n_frames * frame_len].reshape(n_frames, frame_len)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_len - 1)
+    return rms, zcr
+
+
+def voiced_span(
+    audio: np.ndarray,
+    sample_rate: int = SAMPLE_RATE,
+) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) sample range that contains the speech in `audio`, padded
+    by PAD_MS, or None when the recording is silence (or just a click).
+    """
+    frame_len = sample_rate * FRAME_MS // 1000
+    if len(audio) < frame_len:
+        return None
+
+    rms, zcr = frame_features(audio, frame_len)
+    noise_floor = np.percentile(rms, 10)
+    threshold = max(RMS_FLOOR, min(noise_floor * NOISE_RATIO, RMS_CEILING))
+    voiced = (rms >= threshold) & (zcr <= MAX_ZCR)
+
+    if np.count_nonzero(voiced) * FRAME_MS < MIN_SPEECH_MS:
+        return None
+
+    idx = np.flatnonzero(voiced)
+    pad = sample_rate * PAD_MS // 1000
+    start = max(0, idx[0] * frame_len - pad)
+    end = min(len(audio), (idx[-1] + 1) * frame_len + pad)
+    return int(start), int(end)
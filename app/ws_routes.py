@@ -1,25 +1,65 @@
+import asyncio
+import contextvars
+import json
 import os
 import tempfile
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from fastapi.logger import logger
 
 from app.models import Lead
-from app.gemini_service import transcribe_and_analyze, build_response
+from app.admission import (
+    AdmissionRejected,
+    parse_priority,
+    session_limiter,
+    turn_limiter,
+)
+from app.audio_formats import AUDIO_FORMATS
+from app.config import SESSION_RESUME_GRACE_S
+from app.gemini_service import (
+    transcribe,
+    classify_intent,
+    prepare_reply_client,
+    build_prompt_prefix,
+    build_response,
+    build_system_block,
+)
 from app.sentiment import analyze_intent
-from app.elevenlabs_service import generate_tts
+from app.tts_fragments import generate_reply_tts
 from app.database import get_lead_by_id
 from app.conversation_store import get_history, append_turn
+from app.history_manager import history_text, schedule_summary
+from app.persistence import record_outcome, record_turn
+from app.profiling import current_profile, maybe_profile
+from app.resources import stage_executor
+from app.utils import pcm16_to_wav_bytes
+from app.turn_cache import TurnKey, turn_cache, turn_key
+from app.turn_control import CancelToken, TurnCancelled
+from app.session_store import (
+    VoiceSession,
+    create_session,
+    resume_session,
+    detach_session,
+    end_session,
+)
 import time
 
 router = APIRouter()
 
+# Id of the static demo lead; it has no row in the database
+DEMO_LEAD_ID = "demo"
+
+# Close code for a ?resume token that is unknown or past its grace window
+RESUME_EXPIRED_CLOSE_CODE = 4404
+
 
 def get_demo_lead() -> Lead:
     """Return a static demo lead, no database needed."""
     return Lead(
+        id=DEMO_LEAD_ID,
         name="Carlos Pérez",
+        phone_number=0,
         car_model="Sedán 2022",
         car_name="Domu Sedan X",
         car_price_cop=75_000_000,
@@ -27,14 +67,22 @@ def get_demo_lead() -> Lead:
 
 
 
-@router.websocket("/voice")
-async def voice_websocket(ws: WebSocket):
+def open_session(ws: WebSocket) -> Tuple[Optional[VoiceSession], bool]:
     """
-    WebSocket with context:
-    - Receives ?lead_id=...
-    - Uses global in-memory history per lead_id.
+    Resume the session named by ?resume=<token>, or start a new one for
+    ?lead_id=... (the lead lookup and system prompt are cached on it).
+    (None, False) when the resume token is unknown or expired: a new call
+    must not silently continue with another lead.
     """
-    await ws.accept()
+    token = ws.query_params.get("resume")
+    requested_format = ws.query_params.get("format")
+    if token:
+        session = resume_session(token)
+        if session is None:
+            return None, False
+        if requested_format in AUDIO_FORMATS:
+            session.audio_format = requested_format
+        return session, True
 
     lead_id_param = ws.query_params.get("lead_id")
     if lead_id_param:
@@ -45,89 +93,437 @@ async def voice_websocket(ws: WebSocket):
     else:
         lead = get_demo_lead()
 
+    session = create_session(lead, build_system_block(lead))
+    if requested_format in AUDIO_FORMATS:
+        session.audio_format = requested_format
+    session.priority = parse_priority(ws.query_params.get("priority"))
+    session.profile = ws.query_params.get("profile") == "1"
+    return session, False
+
+
+def dedup_scope(session: VoiceSession) -> str:
+    """Retries are matched per lead; demo calls share a lead, so per session."""
+    return session.token if session.lead.id == DEMO_LEAD_ID else session.lead_key
+
+
+def save_outcome(session: VoiceSession) -> None:
+    """Queue the lead's call outcome; write-behind coalesces repeats per lead."""
+    if session.lead.id != DEMO_LEAD_ID:
+        record_outcome(session.lead.id, session.last_intent)
+
+
+def save_outcome_when_settled(session: VoiceSession, turn: Optional[asyncio.Task]) -> None:
+    """On a dropped call the turn in flight may still set last_intent: wait for it."""
+    if turn is None or turn.done():
+        save_outcome(session)
+    else:
+        turn.add_done_callback(lambda _: save_outcome(session))
+
+
+async def reject_busy(ws: WebSocket, e: AdmissionRejected) -> None:
+    """Tell the client to come back later and close with 1013 (Try Again Later)."""
+    print(f"🚦 Sesión rechazada: {e}")
+    await ws.accept()
+    await ws.send_json({"type": "busy", "scope": e.limiter, "retryAfter": e.retry_after})
+    await ws.close(code=1013)
+
+
+async def send_safely(ws: WebSocket, payload: dict) -> None:
+    """Send to the client; the socket may be gone if the call dropped mid-turn."""
+    try:
+        await ws.send_json(payload)
+    except Exception as e:
+        print("⚠️ No se pudo enviar al cliente (socket cerrado):", e)
+
+
+async def handle_utterance(
+    ws: WebSocket,
+    session: VoiceSession,
+    audio_bytes: bytes,
+    suffix: str = ".webm",
+    cancel: Optional[CancelToken] = None,
+    key: Optional[TurnKey] = None,
+) -> None:
+    """
+    Run one full turn (STT → LLM → TTS) and send the reply on the socket.
+    Blocking stages run in worker threads so the socket keeps reading;
+    `cancel` lets a newer utterance or an interrupt abandon this turn.
+    A retry of the same audio for the same lead reuses the cached reply, or
+    waits for the original turn if it is still running.
+    """
+    cancel = cancel or CancelToken()
+    key = key or turn_key(dedup_scope(session), audio_bytes)
+
+    reply = turn_cache.get(key)
+    if reply is not None:
+        print("♻️ Reintento de un turno ya respondido: reenviando la respuesta")
+        await send_safely(ws, reply)
+        return
+
+    pending = turn_cache.inflight(key)
+    if pending is not None:
+        print("♻️ Reintento de un turno en curso: esperando al original")
+        try:
+            # shield: a cancelled retry must not cancel the original turn
+            await send_safely(ws, await asyncio.shield(pending))
+        except TurnCancelled:
+            print("✋ El turno original fue cancelado; se ignora el reintento")
+        except Exception as e:
+            await send_safely(ws, {
+                "type": "error",
+                "message": "Error procesando el audio en el servidor",
+                "detail": str(e),
+            })
+        return
+
+    turn_cache.begin(key)
+    failure: BaseException = TurnCancelled("cancelled")
+
+    # Save incoming audio to a temp file
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(audio_bytes)
+        tmp_path = tmp.name
+
+    try:
+        # Wait briefly for a free turn slot, or shed the turn
+        async with turn_limiter.slot(session.priority):
+            # Off unless the session opted in or the turn is sampled
+            profiler = maybe_profile(session.lead_key, forced=session.profile)
+            current_profile.set(profiler)
+            try:
+                reply = await run_turn(session, tmp_path, cancel)
+            finally:
+                if profiler is not None:
+                    profiler.finish("cancelled" if cancel.cancelled else "")
+
+        # Cache before sending, so a retry after a dropped socket finds it
+        turn_cache.finish(key, reply)
+        await send_safely(ws, reply)
+
+    except AdmissionRejected as e:
+        failure = e
+        print(f"🚦 Turno rechazado: {e}")
+        await send_safely(ws, {"type": "busy", "scope": e.limiter, "retryAfter": e.retry_after})
+
+    except (TurnCancelled, asyncio.CancelledError) as e:
+        failure = e
+        stage = e.stage if isinstance(e, TurnCancelled) else cancel.stage
+        print(f"✋ Turno cancelado (barge-in) durante {stage}")
+
+    except Exception as e:
+        failure = e
+        if cancel.cancelled:
+            print(f"✋ Turno cancelado (barge-in) durante {cancel.stage}")
+            return
+        print("💥 ERROR procesando audio:", e)
+        await send_safely(ws, {
+            "type": "error",
+            "message": "Error procesando el audio en el servidor",
+            "detail": str(e),
+        })
+    finally:
+        # No-op after finish(); otherwise waiting retries learn it failed
+        turn_cache.fail(key, failure)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def run_stage(timings: Dict[str, float], name: str, fn, *args, **kwargs):
+    """
+    Run a blocking stage in a worker thread and record its duration (ms).
+    STT and intent use their own pools (app/resources.py); the rest (network
+    calls) use the default executor.
+    """
+    def timed():
+        profiler = current_profile.get()
+        t = time.perf_counter()
+        try:
+            if profiler is None:
+                return fn(*args, **kwargs)
+            with profiler.stage(name):
+                return fn(*args, **kwargs)
+        finally:
+            timings[name] = (time.perf_counter() - t) * 1000.0
+    ctx = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(stage_executor(name), ctx.run, timed)
+
+
+def load_context(session: VoiceSession) -> Tuple[List[Dict[str, str]], str]:
+    """History and prompt prefix for the next turn; needs no audio."""
+    history = get_history(session.lead_key)
+    budgeted = history_text(session.lead_key, history)
+    return history, build_prompt_prefix(session.lead, history, session.system_block, budgeted)
+
+
+async def run_turn(session: VoiceSession, tmp_path: str, cancel: CancelToken) -> dict:
+    """
+    The stages of one admitted turn, as a small dependency graph:
+
+        STT ───────────────┬─> intent ──┐
+        history + prefix ──┼────────────┼─> LLM ─> TTS
+                           └─> LLM client setup ┘
+
+    Context loading overlaps decoding, and intent overlaps the LLM setup,
+    so the turn costs roughly its critical path, not the sum of the stages.
+    """
+    lead = session.lead
+    lead_key = session.lead_key
+    timings: Dict[str, float] = {}
+    pending: List[asyncio.Task] = []
+
+    def spawn(name: str, fn, *args, **kwargs) -> asyncio.Task:
+        task = asyncio.create_task(run_stage(timings, name, fn, *args, **kwargs))
+        pending.append(task)
+        return task
+
+    t0 = time.perf_counter()
+    try:
+        # 1) STT, with history + prompt prefix built meanwhile
+        stt_task = spawn("stt", transcribe, tmp_path, cancel=cancel)
+        context_task = spawn("context", load_context, session)
+        user_text = await stt_task
+        if not user_text.strip():
+            # Silence or noise only: nothing to answer, so no intent, LLM or TTS
+            # (and nothing to add to the history)
+            print("🤫 Audio sin voz: se omiten intención, Gemini y ElevenLabs")
+            return {
+                "type": "reply",
+                "userText": "",
+                "intent": "NEUTRAL",
+                "replyText": "",
+                "audioUrl": None,
+                "noSpeech": True,
+            }
+
+        # 2) Intent as soon as the last segment is in, LLM setup alongside
+        intent_task = spawn("intent", classify_intent, user_text, cancel=cancel)
+        setup_task = spawn("setup", prepare_reply_client)
+        history, prompt_prefix = await context_task
+        await setup_task
+        intent = await intent_task
+        print({"transcript": user_text, "intent": intent})
+    finally:
+        # A failed or cancelled stage must not leave siblings unobserved
+        for task in pending:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # mark as retrieved
+
+    # 3) Build response with context (system prompt cached on the session)
+    reply_text = await run_stage(
+        timings, "llm",
+        build_response, lead, user_text, intent, history, session.system_block, cancel,
+        prompt_prefix=prompt_prefix,
+    )
+
+    # 4) TTS
+    audio_url = await run_stage(
+        timings, "tts",
+        generate_reply_tts,
+        reply_text,
+        prefix=f"ws_reply_{lead.id}",
+        audio_format=session.audio_format,
+        cancel=cancel,
+    )
+    cancel.check()
+
+    total_ms = (time.perf_counter() - t0) * 1000.0
+    print(
+        "📊 PERF → "
+        + " | ".join(f"{name.upper()}={ms:.1f}ms" for name, ms in timings.items())
+        + f" | TOTAL={total_ms:.1f}ms (suma etapas={sum(timings.values()):.1f}ms)"
+    )
+
+    # 5) Append new turn to global history (and queue it for the database)
+    append_turn(lead_key, user_text, reply_text)
+    session.last_intent = intent
+    schedule_summary(lead_key, get_history(lead_key))
+    if lead.id != DEMO_LEAD_ID:
+        record_turn(lead.id, user_text, reply_text, intent)
+    new_history = get_history(lead_key)
+    print("📚 History length:", len(new_history))
+    for i, turn in enumerate(new_history[-3:], start=1):
+        print(f"  Turn {len(new_history)-3+i}:")
+        print("    Usuario:", turn.get("user"))
+        print("    Agente:", turn.get("agent"))
+
+    # 6) Reply for the frontend
+    return {
+        "type": "reply",
+        "userText": user_text,
+        "intent": intent,
+        "replyText": reply_text,
+        "audioUrl": audio_url,
+    }
+
+
+@router.websocket("/voice")
+async def voice_websocket(ws: WebSocket):
+    """
+    Long-lived WebSocket for a whole call:
+    - Receives ?lead_id=... for a new call, or ?resume=<token> to reattach.
+    - Optional ?format=opus_32 (or {"type": "set_format"}) picks the TTS format.
+    - Sends {"type": "session", "resumeToken": ...} right after connecting.
+    - Each binary message is one utterance, or raw PCM16 chunks can be
+      streamed between {"type": "audio_start"} and {"type": "audio_end"}.
+    - A new utterance or {"type": "interrupt"} cancels the turn in flight;
+      resending the same audio (a retry) reuses that turn instead.
+    - Text {"type": "end"} ends the call.
+    - Uses global in-memory history per lead_id.
+    - ?priority=prewarm marks background calls that yield to live callers;
+      when the server is full the client gets {"type": "busy", "retryAfter": N}
+      and the socket is closed with 1013.
+    - ?profile=1 saves a stack profile of every turn (see /admin/profiles).
+    """
+    priority = parse_priority(ws.query_params.get("priority"))
+    try:
+        async with session_limiter.slot(priority):
+            await run_call(ws)
+    except AdmissionRejected as e:
+        await reject_busy(ws, e)
+
+
+async def run_call(ws: WebSocket) -> None:
+    """Serve one admitted call until the client ends it or disconnects."""
+    await ws.accept()
+
+    session, resumed = open_session(ws)
+    if session is None:
+        print("⚠️ Resume token desconocido o expirado: se rechaza la reconexión")
+        await ws.send_json({
+            "type": "error",
+            "code": "resume_expired",
+            "message": "La sesión expiró; inicia una llamada nueva",
+        })
+        await ws.close(code=RESUME_EXPIRED_CLOSE_CODE)
+        return
+    lead = session.lead
+
     # This key will be used to store and retrieve conversation history
-    lead_key = str(lead.id)
-    print("🔌 WebSocket iniciado con lead:", lead.name, "ID:", lead_key)
+    lead_key = session.lead_key
+    print(
+        "🔌 WebSocket", "reanudado" if resumed else "iniciado",
+        "con lead:", lead.name, "ID:", lead_key,
+    )
+
+    await ws.send_json({
+        "type": "session",
+        "resumeToken": session.token,
+        "resumed": resumed,
+        "leadId": lead.id,
+        "leadName": lead.name,
+        "graceSeconds": SESSION_RESUME_GRACE_S,
+        "audioFormat": session.audio_format,
+        "audioFormats": list(AUDIO_FORMATS),
+    })
+
+    # Chunked upload in progress: {"type": "audio_start"} ... {"type": "audio_end"}
+    stream_buf: Optional[bytearray] = None
+    stream_rate = 16000
+
+    # The turn being processed, so a new utterance can barge in on it
+    turn_task: Optional[asyncio.Task] = None
+    turn_cancel: Optional[CancelToken] = None
+    current_key: Optional[TurnKey] = None
+
+    def interrupt_turn() -> bool:
+        """Cancel the in-flight turn (if any); True if something was cancelled."""
+        if turn_task is None or turn_task.done():
+            return False
+        turn_cancel.cancel()
+        turn_task.cancel()
+        return True
+
+    def start_turn(audio: bytes, suffix: str = ".webm") -> None:
+        nonlocal turn_task, turn_cancel, current_key
+        key = turn_key(dedup_scope(session), audio)
+        if key == current_key and turn_task is not None and not turn_task.done():
+            # Client resent the utterance we are answering: not a barge-in
+            print("♻️ Reintento del turno en curso: el original responderá")
+            return
+        if interrupt_turn():
+            print("✋ Nuevo audio del cliente: cancelando el turno anterior")
+        current_key = key
+        turn_cancel = CancelToken()
+        turn_task = asyncio.create_task(
+            handle_utterance(ws, session, audio, suffix, cancel=turn_cancel, key=key)
+        )
 
     try:
         while True:
-            try:
-                audio_bytes = await ws.receive_bytes()
-            except WebSocketDisconnect:
-                print("❌ Cliente desconectado mientras enviaba audio")
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                # The turn in flight keeps running: its reply lands in the
+                # turn cache, where the client's retry after resuming finds it
+                print("❌ Cliente desconectado")
+                detach_session(session)
+                save_outcome_when_settled(session, turn_task)
                 break
 
-            # Save incoming audio to a temp file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as tmp:
-                tmp.write(audio_bytes)
-                tmp_path = tmp.name
+            if message.get("text") is not None:
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    control = {}
+                if not isinstance(control, dict):
+                    # Valid JSON but not an object (123, [], null): ignore it
+                    await ws.send_json({
+                        "type": "error",
+                        "message": "Mensaje de control inválido: se esperaba un objeto JSON",
+                    })
+                    continue
+                msg_type = control.get("type")
 
-            try:
-                t0 = time.perf_counter()
-
-                # 1) STT + intent
-                analysis = transcribe_and_analyze(tmp_path)
-                user_text = analysis["transcript"]
-                intent = analysis["intent"]
-                print({"transcript": user_text, "intent": intent})
-
-                # 2) Get current history for this lead
-                history = get_history(lead_key)
-
-                # Debug: what we send as history
-                history_block = ""
-                for turn in history[-5:]:
-                    history_block += (
-                        f"Usuario: {turn.get('user')}\n"
-                        f"Agente: {turn.get('agent')}\n\n"
-                    )
-                print("🧵 HISTORY BLOCK SENT TO GEMINI:")
-                print(history_block if history_block else "[Sin mensajes previos]")
-
-                # 3) Build response with context
-                t_resp = time.perf_counter()
-                reply_text = build_response(lead, user_text, intent, history)
-                resp_ms = (time.perf_counter() - t_resp) * 1000.0
-
-                # 4) TTS
-                t_tts = time.perf_counter()
-                audio_url = generate_tts(reply_text, prefix=f"ws_reply_{lead.id}")
-                tts_ms = (time.perf_counter() - t_tts) * 1000.0
-
-                total_ms = (time.perf_counter() - t0) * 1000.0
-                print(
-                    f"📊 PERF → RESP={resp_ms:.1f}ms | "
-                    f"TTS={tts_ms:.1f}ms | TOTAL={total_ms:.1f}ms"
-                )
-
-                # 5) Append new turn to global history
-                append_turn(lead_key, user_text, reply_text)
-                new_history = get_history(lead_key)
-                print("📚 History length:", len(new_history))
-                for i, turn in enumerate(new_history[-3:], start=1):
-                    print(f"  Turn {len(new_history)-3+i}:")
-                    print("    Usuario:", turn.get("user"))
-                    print("    Agente:", turn.get("agent"))
-
-                # 6) Send reply to frontend
-                await ws.send_json({
-                    "type": "reply",
-                    "userText": user_text,
-                    "intent": intent,
-                    "replyText": reply_text,
-                    "audioUrl": audio_url,
-                })
-
-            except Exception as e:
-                print("💥 ERROR procesando audio:", e)
-                await ws.send_json({
-                    "type": "error",
-                    "message": "Error procesando el audio en el servidor",
-                    "detail": str(e),
-                })
-            finally:
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
+                if msg_type == "end":
+                    print("📴 Llamada finalizada por el cliente")
+                    interrupt_turn()
+                    end_session(session)
+                    save_outcome(session)
+                    await ws.close()
+                    break
+                if msg_type == "ping":
+                    await ws.send_json({"type": "pong"})
+                elif msg_type == "interrupt":
+                    cancelled = interrupt_turn()
+                    await ws.send_json({"type": "interrupted", "cancelled": cancelled})
+                elif msg_type == "set_format":
+                    # Switch TTS output format mid-call (e.g. the link got worse)
+                    if control.get("format") in AUDIO_FORMATS:
+                        session.audio_format = control["format"]
+                    await ws.send_json({"type": "format", "audioFormat": session.audio_format})
+                elif msg_type == "audio_start":
+                    # Raw PCM16 mono chunks follow until audio_end
+                    try:
+                        rate = int(control.get("sampleRate", 16000))
+                    except (TypeError, ValueError):
+                        rate = 0
+                    if rate <= 0:
+                        await ws.send_json({
+                            "type": "error",
+                            "message": "sampleRate inválido en audio_start",
+                        })
+                        continue
+                    stream_buf = bytearray()
+                    stream_rate = rate
+                elif msg_type == "audio_end" and stream_buf is not None:
+                    wav_bytes = pcm16_to_wav_bytes(bytes(stream_buf), stream_rate)
+                    stream_buf = None
+                    start_turn(wav_bytes, suffix=".wav")
+                continue
+
+            audio_bytes = message.get("bytes")
+            if not audio_bytes:
+                continue
+
+            if stream_buf is not None:
+                stream_buf.extend(audio_bytes)
+                continue
+
+            start_turn(audio_bytes)
 
     except WebSocketDisconnect:
-        print("🔌 Cliente desconectado")
\ No newline at end of file
+        print("🔌 Cliente desconectado")
+        detach_session(session)
+        save_outcome_when_settled(session, turn_task)
@@ -0,0 +1,249 @@
+# comments in English only
+
+"""
+Offline batch transcription + intent analytics over recorded calls.
+
+Walks a directory (or reads a manifest) of audio files and fans them out over
+a process pool. Each worker loads its own Whisper and BETO models once and
+reuses them for every file it gets. Results are written incrementally, and a
+checkpoint file lists the finished files, so an interrupted run picks up
+where it stopped when launched again with the same --output.
+
+Examples:
+    python batch_analyze.py recordings/ --output scores.jsonl
+    python batch_analyze.py manifest.txt --workers 8 --output scores.parquet
+
+A manifest is a text file with one audio path per line, or a .jsonl file with
+{"path": ..., "id": ...} objects. Parquet output needs `pyarrow` and is written
+as a directory of part files, one per flushed batch.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Set
+
+AUDIO_EXTENSIONS = {".webm", ".wav", ".mp3", ".ogg", ".opus", ".m4a", ".flac"}
+
+
+# -------------------------------------------------------------------
+# INPUTS
+# -------------------------------------------------------------------
+def iter_inputs(source: str) -> Iterator[Dict[str, str]]:
+    """Yield {"id", "path"} for every audio file in a directory or manifest."""
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                    path = os.path.abspath(os.path.join(root, name))
+                    yield {"id": os.path.relpath(path, source), "path": path}
+        return
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                path = entry["path"]
+                item_id = str(entry.get("id") or path)
+            else:
+                path = item_id = line
+            yield {"id": item_id, "path": os.path.abspath(os.path.join(base, path))}
+
+
+# -------------------------------------------------------------------
+# WORKERS (one Whisper + BETO instance per process)
+# -------------------------------------------------------------------
+def init_worker(threads: int, verbose: bool) -> None:
+    """Load the models once per worker, pinned to `threads` CPU threads."""
+    # STT and intent run one after the other here, so both get all `threads`
+    # (app/resources.py reads these when gemini_service loads the models)
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["CPU_BUDGET"] = str(threads)
+    os.environ["WHISPER_CORES"] = os.environ["CLASSIFIER_CORES"] = str(threads)
+    os.environ["WHISPER_WORKERS"] = "1"
+    os.environ["WHISPER_BATCH_SIZE"] = "1"  # one file at a time per process
+    if not verbose:
+        # gemini_service prints every segment; keep the batch log readable
+        sys.stdout = open(os.devnull, "w")
+
+    import app.gemini_service  # noqa: F401  (loads Whisper + BETO)
+
+
+def analyze_file(item: Dict[str, str]) -> Dict:
+    """Transcribe one recording and classify its intent."""
+    from app.gemini_service import classify_intent, transcribe
+
+    t0 = time.perf_counter()
+    transcript = transcribe(item["path"])
+    t_stt = time.perf_counter()
+    intent = classify_intent(transcript)
+    t_end = time.perf_counter()
+
+    return {
+        "id": item["id"],
+        "path": item["path"],
+        "transcript": transcript,
+        "intent": intent,
+        "stt_ms": round((t_stt - t0) * 1000.0, 1),
+        "intent_ms": round((t_end - t_stt) * 1000.0, 1),
+        "total_ms": round((t_end - t0) * 1000.0, 1),
+        "worker_pid": os.getpid(),
+    }
+
+
+# -------------------------------------------------------------------
+# OUTPUT + CHECKPOINT
+# -------------------------------------------------------------------
+class ResultWriter:
+    """
+    Buffers results and appends them to JSONL or Parquet in batches.
+    File ids go to the checkpoint only after their batch is on disk.
+    """
+
+    def __init__(self, output: str, checkpoint: str, batch_size: int):
+        self.output = output
+        self.checkpoint = checkpoint
+        self.batch_size = max(1, batch_size)
+        self.parquet = output.endswith(".parquet")
+        self.buffer: List[Dict] = []
+
+        if self.parquet:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise SystemExit("Parquet output needs pyarrow (pip install pyarrow)")
+            os.makedirs(output, exist_ok=True)
+
+    def write(self, record: Dict) -> None:
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            part = os.path.join(self.output, f"part-{time.time_ns()}.parquet")
+            pq.write_table(pa.Table.from_pylist(self.buffer), part)
+        else:
+            with open(self.output, "a", encoding="utf-8") as f:
+                for record in self.buffer:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+        with open(self.checkpoint, "a", encoding="utf-8") as f:
+            for record in self.buffer:
+                f.write(record["id"] + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.buffer = []
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+# -------------------------------------------------------------------
+# MAIN
+# -------------------------------------------------------------------
+def run(args) -> Dict[str, float]:
+    checkpoint = args.checkpoint or args.output.rstrip("/") + ".checkpoint"
+    done = load_checkpoint(checkpoint)
+    todo = [item for item in iter_inputs(args.source) if item["id"] not in done]
+
+    workers = args.workers or max(1, (os.cpu_count() or 1) // args.threads)
+    print(f"🗂️ {len(todo)} archivos pendientes ({len(done)} ya procesados), "
+          f"{workers} workers × {args.threads} hilos")
+    if not todo:
+        return {"processed": 0, "failed": 0, "wall_s": 0.0}
+
+    writer = ResultWriter(args.output, checkpoint, args.batch_size)
+    processed = failed = 0
+    t_start = time.perf_counter()
+
+    # spawn: every worker starts clean and loads its own models
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=init_worker,
+        initargs=(args.threads, args.verbose),
+    ) as pool:
+        items = iter(todo)
+        in_flight = {}
+
+        def submit_next() -> bool:
+            item = next(items, None)
+            if item is None:
+                return False
+            in_flight[pool.submit(analyze_file, item)] = item
+            return True
+
+        # Keep a bounded number of files queued instead of submitting them all
+        for _ in range(workers * 2):
+            if not submit_next():
+                break
+
+        try:
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    item = in_flight.pop(fut)
+                    try:
+                        writer.write(fut.result())
+                        processed += 1
+                    except Exception as e:
+                        # Not checkpointed, so the next run retries it
+                        failed += 1
+                        print(f"💥 {item['id']}: {e}")
+                    submit_next()
+
+                total = processed + failed
+                if total % args.progress_every == 0:
+                    rate = processed / (time.perf_counter() - t_start)
+                    print(f"⏱️ {total}/{len(todo)} ({rate:.2f} archivos/s)")
+        finally:
+            # Keep everything finished so far, even on Ctrl+C
+            writer.flush()
+
+    wall_s = time.perf_counter() - t_start
+    print(f"✅ {processed} procesados, {failed} fallidos en {wall_s:.1f}s "
+          f"({processed / wall_s if wall_s else 0:.2f} archivos/s) → {args.output}")
+    return {"processed": processed, "failed": failed, "wall_s": wall_s}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batch Whisper + intent analytics over recorded calls.")
+    parser.add_argument("source", help="Directory of recordings, or a manifest (.txt / .jsonl)")
+    parser.add_argument("--output", default="batch_results.jsonl", help=".jsonl file or .parquet directory")
+    parser.add_argument("--checkpoint", help="Finished-file list (default: <output>.checkpoint)")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: cores / threads)")
+    parser.add_argument("--threads", type=int, default=1, help="CPU threads per worker")
+    parser.add_argument("--batch-size", type=int, default=20, help="Results per flush to disk")
+    parser.add_argument("--progress-every", type=int, default=50)
+    parser.add_argument("--verbose", action="store_true", help="Show per-segment logs from workers")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        run(parse_args())
+    except KeyboardInterrupt:
+        print("⏸️ Interrumpido: vuelve a ejecutar con el mismo --output para continuar")
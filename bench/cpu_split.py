@@ -0,0 +1,160 @@
+"""
+Tail latency of concurrent turns under different CPU splits.
+
+    python -m bench.cpu_split --splits 6:1:1,4:2:2,2:2:4 --callers 8 --turns 5
+    python -m bench.cpu_split --splits 6:1:1,4:2:2 --pin
+
+Each split is WHISPER:CLASSIFIER:API cores (budget = their sum) and runs in
+its own process, since thread counts are fixed when the models load. Callers
+run STT + intent on a fixture through the same pools as /ws/voice while a
+probe measures how late the event loop wakes up (the API's responsiveness).
+"""
+
+# All comments in English.
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+
+# How often the event-loop probe wakes up (seconds)
+PROBE_INTERVAL_S = 0.01
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# -------------------------------------------------------------------
+# CHILD: one split, models loaded with its thread counts
+# -------------------------------------------------------------------
+async def _measure(path: str, callers: int, turns: int) -> Dict:
+    from app import gemini_service
+    from app.resources import classifier_pool, pin_event_loop, whisper_pool
+
+    pin_event_loop()
+    loop = asyncio.get_running_loop()
+    latencies: List[float] = []
+    lags: List[float] = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            t = time.perf_counter()
+            await asyncio.sleep(PROBE_INTERVAL_S)
+            lags.append((time.perf_counter() - t - PROBE_INTERVAL_S) * 1000.0)
+
+    async def caller():
+        for _ in range(turns):
+            t = time.perf_counter()
+            text = await loop.run_in_executor(whisper_pool, gemini_service.transcribe, path)
+            await loop.run_in_executor(classifier_pool, gemini_service.classify_intent, text)
+            latencies.append((time.perf_counter() - t) * 1000.0)
+
+    # Warm up both pools (first calls allocate model buffers)
+    text = await loop.run_in_executor(whisper_pool, gemini_service.transcribe, path)
+    await loop.run_in_executor(classifier_pool, gemini_service.classify_intent, text)
+
+    probe_task = asyncio.create_task(probe())
+    t0 = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(callers)))
+    wall = time.perf_counter() - t0
+    done.set()
+    await probe_task
+
+    return {
+        "turns": len(latencies),
+        "turnsPerS": round(len(latencies) / wall, 2),
+        "p50": round(percentile(latencies, 0.50), 1),
+        "p95": round(percentile(latencies, 0.95), 1),
+        "p99": round(percentile(latencies, 0.99), 1),
+        "loopLagP99": round(percentile(lags, 0.99), 2),
+    }
+
+
+def child(args: argparse.Namespace) -> int:
+    # Keep the per-segment logs of gemini_service out of the result line
+    out = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    path = os.path.join(FIXTURES_DIR, f"{args.fixture}.webm")
+    result = asyncio.run(_measure(path, args.callers, args.turns))
+
+    from app.resources import allocation
+    result["allocation"] = allocation()
+    out.write(json.dumps(result) + "\n")
+    return 0
+
+
+# -------------------------------------------------------------------
+# PARENT: one child process per split
+# -------------------------------------------------------------------
+def run_split(split: str, args: argparse.Namespace) -> Optional[Dict]:
+    whisper, classifier, api = (int(x) for x in split.split(":"))
+    env = dict(
+        os.environ,
+        CPU_BUDGET=str(whisper + classifier + api),
+        WHISPER_CORES=str(whisper),
+        CLASSIFIER_CORES=str(classifier),
+        API_CORES=str(api),
+        CPU_PINNING="1" if args.pin else "",
+    )
+    if args.whisper_workers:
+        env["WHISPER_WORKERS"] = str(args.whisper_workers)
+    cmd = [
+        sys.executable, "-m", "bench.cpu_split", "--child",
+        "--fixture", args.fixture, "--callers", str(args.callers), "--turns", str(args.turns),
+    ]
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(f"💥 {split} falló:\n{proc.stderr[-2000:]}")
+        return None
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Turn latency under different CPU splits.")
+    parser.add_argument("--splits", default="6:1:1,4:2:2,2:2:4",
+                        help="Comma-separated WHISPER:CLASSIFIER:API core counts")
+    parser.add_argument("--callers", type=int, default=8, help="Concurrent callers")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per caller")
+    parser.add_argument("--fixture", default="short", help="Audio fixture in bench/fixtures")
+    parser.add_argument("--whisper-workers", type=int, default=0, help="Override concurrent transcriptions")
+    parser.add_argument("--pin", action="store_true", help="Also pin each group to its cores")
+    parser.add_argument("--json", help="Write all results here")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return child(args)
+
+    results = {}
+    print(f"{'split':>10} {'whisper':>8} {'turns/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'loop p99':>9}")
+    for split in args.splits.split(","):
+        r = run_split(split.strip(), args)
+        if r is None:
+            continue
+        results[split] = r
+        w = r["allocation"]["whisper"]
+        print(
+            f"{split:>10} {w['workers']}x{w['threadsPerWorker']:<6} {r['turnsPerS']:>8} "
+            f"{r['p50']:>6.0f}ms {r['p95']:>6.0f}ms {r['p99']:>6.0f}ms {r['loopLagP99']:>7.1f}ms"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
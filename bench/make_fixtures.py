@@ -0,0 +1,73 @@
+"""
+Regenerate the audio fixtures used by bench/microbench.py.
+
+The fixtures are built from test.webm (one short Spanish utterance) by
+repeating it with short pauses, and are encoded as WebM/Opus like the
+React client sends them:
+
+    python -m bench.make_fixtures
+"""
+
+# All comments in English.
+
+import os
+
+import av
+import numpy as np
+from faster_whisper.audio import decode_audio
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_FILE = os.path.join(BASE_DIR, "test.webm")
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+SAMPLE_RATE = 16000
+PAUSE_S = 0.4
+
+# fixture name -> number of repetitions of the source utterance
+FIXTURES = {
+    "short": 1,   # ~2 s
+    "medium": 3,  # ~8 s
+    "long": 8,    # ~22 s
+}
+
+
+def build_pcm(repeats: int) -> np.ndarray:
+    """Tile the source utterance with short pauses in between."""
+    speech = decode_audio(SOURCE_FILE, sampling_rate=SAMPLE_RATE)
+    pause = np.zeros(int(PAUSE_S * SAMPLE_RATE), dtype=np.float32)
+    parts = []
+    for i in range(repeats):
+        if i:
+            parts.append(pause)
+        parts.append(speech)
+    return np.concatenate(parts)
+
+
+def write_webm(path: str, pcm: np.ndarray) -> None:
+    """Encode float32 mono PCM as WebM/Opus at 48 kHz."""
+    samples = (np.clip(pcm, -1.0, 1.0) * 32767).astype(np.int16)
+    with av.open(path, "w", format="webm") as out:
+        stream = out.add_stream("libopus", rate=48000)
+        stream.layout = "mono"
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=48000)
+
+        frame = av.AudioFrame.from_ndarray(samples.reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = SAMPLE_RATE
+        for resampled in resampler.resample(frame) + resampler.resample(None):
+            for packet in stream.encode(resampled):
+                out.mux(packet)
+        for packet in stream.encode(None):
+            out.mux(packet)
+
+
+def main() -> None:
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for name, repeats in FIXTURES.items():
+        pcm = build_pcm(repeats)
+        path = os.path.join(FIXTURES_DIR, f"{name}.webm")
+        write_webm(path, pcm)
+        print(f"🎧 {path}: {len(pcm) / SAMPLE_RATE:.1f}s, {os.path.getsize(path)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Microbenchmarks for the CPU-bound pieces of a voice turn.
+
+    python -m bench.microbench run --output bench/baselines/local.json
+    python -m bench.microbench run --compare bench/baselines/local.json
+    python -m bench.microbench compare old.json new.json --threshold 0.10
+
+`compare` (and `run --compare`) exits with status 1 when any benchmark's
+median is slower than the baseline by more than the threshold.
+"""
+
+# All comments in English.
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+AUDIO_FIXTURES = ["short", "medium", "long"]
+
+SHORT_TEXT = "Sí, me interesa, cuéntame más"
+LONG_TEXT = (
+    "Mira, la verdad ahorita estoy un poco ocupado con el trabajo, pero el carro sí lo "
+    "quiero vender pronto. ¿Cuánto me dijiste que vale el plan intermedio? Llámame más "
+    "tarde o mañana después de las cinco y lo hablamos con calma, ¿listo?"
+)
+
+# name -> (callable, iterations, warmup)
+Benchmark = Tuple[Callable[[], object], int, int]
+
+
+class _StubReply:
+    text = "Perfecto, te recomiendo el plan Intermedia. ¿Te queda bien el sábado?"
+
+
+class _StubModel:
+    """Stand-in for the Gemini model so build_response only measures our code."""
+
+    def generate_content(self, prompt):
+        return _StubReply()
+
+
+def collect_benchmarks(quick: bool = False) -> Dict[str, Benchmark]:
+    """Import the app modules lazily and return the registered benchmarks."""
+    import numpy as np
+    from faster_whisper import decode_audio
+
+    from app import gemini_service, history_manager, sentiment, utils, vad
+    from app.models import Lead
+
+    scale = 0.2 if quick else 1.0
+
+    def n(iterations: int) -> int:
+        return max(3, int(iterations * scale))
+
+    lead = Lead(
+        id="bench",
+        name="Carlos Pérez",
+        phone_number=3001234567,
+        car_model="2022",
+        car_name="Mazda CX-30",
+        car_price_cop=95_000_000,
+    )
+    history = [
+        {"user": "Hola, ¿quién habla?", "agent": "Hola Carlos, te llamo de Domu por tu carro."},
+        {"user": "Ah listo, cuéntame", "agent": "Tenemos tres planes de lavado y fotos."},
+        {"user": "¿Cuánto vale el premium?", "agent": "El premium cuesta 350 mil más IVA."},
+    ] * 4
+    system_block = gemini_service.build_system_block(lead)
+
+    gemini_service.reply_model = _StubModel()
+
+    # A call long enough to overflow the verbatim window, with its older turns
+    # already folded: the steady state of the prompt the server builds.
+    history_manager._summaries["bench"] = history_manager.RollingSummary(
+        text=_StubReply.text, upto=history_manager.recent_start(history)
+    )
+
+    def build_response() -> str:
+        # Same path as ws_routes.load_context + run_turn
+        budgeted = history_manager.history_text("bench", history)
+        prefix = gemini_service.build_prompt_prefix(lead, history, system_block, budgeted)
+        return gemini_service.build_response(
+            lead, SHORT_TEXT, "INTERESTED", history, system_block, prompt_prefix=prefix
+        )
+
+    benches: Dict[str, Benchmark] = {
+        "utils.normalize_text[short]": (lambda: utils.normalize_text(SHORT_TEXT), n(20000), 200),
+        "utils.normalize_text[long]": (lambda: utils.normalize_text(LONG_TEXT), n(20000), 200),
+        "sentiment.analyze_intent[short]": (lambda: sentiment.analyze_intent(SHORT_TEXT), n(20000), 200),
+        "sentiment.analyze_intent[long]": (lambda: sentiment.analyze_intent(LONG_TEXT), n(20000), 200),
+        "gemini.classify_intent_fast[short]": (lambda: gemini_service.classify_intent_fast(SHORT_TEXT), n(200), 10),
+        "gemini.classify_intent_fast[long]": (lambda: gemini_service.classify_intent_fast(LONG_TEXT), n(200), 10),
+        "gemini.build_response[stub_model]": (build_response, n(5000), 50),
+    }
+
+    for name in AUDIO_FIXTURES:
+        path = os.path.join(FIXTURES_DIR, f"{name}.webm")
+        benches[f"gemini.transcribe_and_analyze[{name}]"] = (
+            lambda path=path: gemini_service.transcribe_and_analyze(path),
+            n(10),
+            1,
+        )
+        pcm = decode_audio(path, sampling_rate=vad.SAMPLE_RATE)
+        benches[f"vad.voiced_span[{name}]"] = (lambda pcm=pcm: vad.voiced_span(pcm), n(500), 10)
+
+    silence = np.zeros(5 * vad.SAMPLE_RATE, dtype=np.float32)
+    benches["vad.voiced_span[silence_5s]"] = (lambda: vad.voiced_span(silence), n(500), 10)
+
+    return benches
+
+
+def time_benchmark(fn: Callable[[], object], iterations: int, warmup: int) -> Dict[str, float]:
+    """Run fn warmup + iterations times and return timing stats in ms."""
+    for _ in range(warmup):
+        fn()
+
+    samples: List[float] = []
+    for _ in range(iterations):
+        t0 = time.perf_counter_ns()
+        fn()
+        samples.append((time.perf_counter_ns() - t0) / 1e6)
+
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "mean_ms": statistics.fmean(samples),
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+        "min_ms": samples[0],
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCH_DIR, capture_output=True, text=True, check=True,
+        )
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+
+def run(only: Optional[str] = None, quick: bool = False) -> Dict:
+    """Run all (or the matching) benchmarks and return a results document."""
+    benches = collect_benchmarks(quick=quick)
+    results = {}
+
+    for name, (fn, iterations, warmup) in benches.items():
+        if only and only not in name:
+            continue
+        # The app logs every step with print(); keep the terminal readable
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            stats = time_benchmark(fn, iterations, warmup)
+        results[name] = stats
+        print(f"⏱️  {name:<42} median={stats['median_ms']:.4f}ms  p95={stats['p95_ms']:.4f}ms  (n={iterations})")
+
+    return {
+        "meta": {
+            "created_at": datetime.datetime.utcnow().isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict, current: Dict, threshold: float, min_delta_ms: float) -> List[str]:
+    """Print a comparison table and return the names that regressed."""
+    regressions = []
+    base_results = baseline.get("results", {})
+    cur_results = current.get("results", {})
+
+    print(f"{'benchmark':<44}{'base':>12}{'current':>12}{'change':>10}")
+    for name in sorted(set(base_results) | set(cur_results)):
+        if name not in base_results or name not in cur_results:
+            side = "baseline" if name not in base_results else "current"
+            print(f"{name:<44}{'(missing in ' + side + ')':>34}")
+            continue
+
+        base_ms = base_results[name]["median_ms"]
+        cur_ms = cur_results[name]["median_ms"]
+        change = (cur_ms - base_ms) / base_ms if base_ms > 0 else 0.0
+        flag = ""
+        if change > threshold and (cur_ms - base_ms) >= min_delta_ms:
+            regressions.append(name)
+            flag = "  ❌ REGRESSION"
+        print(f"{name:<44}{base_ms:>10.4f}ms{cur_ms:>10.4f}ms{change:>+9.1%}{flag}")
+
+    if regressions:
+        print(f"\n💥 {len(regressions)} regression(s) beyond {threshold:.0%}")
+    else:
+        print(f"\n✅ No regressions beyond {threshold:.0%}")
+    return regressions
+
+
+def _load(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Component microbenchmarks with JSON baselines.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Run the benchmarks")
+    p_run.add_argument("--only", help="Only run benchmarks whose name contains this string")
+    p_run.add_argument("--quick", action="store_true", help="Fewer iterations (noisier)")
+    p_run.add_argument("--output", help="Write results JSON here (e.g. a new baseline)")
+    p_run.add_argument("--compare", help="Baseline JSON to compare the results against")
+
+    p_cmp = sub.add_parser("compare", help="Compare two result files")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("current")
+
+    for p in (p_run, p_cmp):
+        p.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown (0.10 = 10%%)")
+        p.add_argument("--min-delta-ms", type=float, default=0.001, help="Ignore smaller absolute changes")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        regressions = compare(_load(args.baseline), _load(args.current), args.threshold, args.min_delta_ms)
+        return 1 if regressions else 0
+
+    current = run(only=args.only, quick=args.quick)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print("📄 Results written to", args.output)
+    if args.compare:
+        regressions = compare(_load(args.compare), current, args.threshold, args.min_delta_ms)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
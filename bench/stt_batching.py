@@ -0,0 +1,118 @@
+"""
+Aggregate STT throughput vs single-request latency for batch sizes.
+
+    python -m bench.stt_batching --batch-sizes 1,4,8 --callers 8 --rounds 3
+    python -m bench.stt_batching --batch-sizes 1,8 --window-ms 10,40 --fixture medium
+
+Each (batch size, window) runs in its own process, since Whisper is set up at
+import. It reports the latency of one utterance on an idle server, then
+utterances/s and per-utterance latency with `callers` concurrent turns
+(batch size 1 is the sequential decoder, as with WHISPER_BATCH_SIZE=1).
+"""
+
+# All comments in English.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from bench.cpu_split import FIXTURES_DIR, percentile
+
+
+# -------------------------------------------------------------------
+# CHILD: one configuration
+# -------------------------------------------------------------------
+def child(args: argparse.Namespace) -> int:
+    # Keep the per-segment logs of gemini_service out of the result line
+    out = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    from app import gemini_service
+
+    path = os.path.join(FIXTURES_DIR, f"{args.fixture}.webm")
+    gemini_service.transcribe(path)  # warm-up
+
+    singles = []
+    for _ in range(args.rounds):
+        t = time.perf_counter()
+        gemini_service.transcribe(path)
+        singles.append((time.perf_counter() - t) * 1000.0)
+
+    def timed(_):
+        t = time.perf_counter()
+        gemini_service.transcribe(path)
+        return (time.perf_counter() - t) * 1000.0
+
+    n = args.callers * args.rounds
+    with ThreadPoolExecutor(max_workers=args.callers) as pool:
+        t0 = time.perf_counter()
+        latencies = list(pool.map(timed, range(n)))
+        wall = time.perf_counter() - t0
+
+    batcher = gemini_service.stt_batcher
+    out.write(json.dumps({
+        "singleP50": round(percentile(singles, 0.50), 1),
+        "utterancesPerS": round(n / wall, 2),
+        "p50": round(percentile(latencies, 0.50), 1),
+        "p95": round(percentile(latencies, 0.95), 1),
+        "avgBatch": batcher.stats()["avgBatch"] if batcher else 1.0,
+    }) + "\n")
+    return 0
+
+
+# -------------------------------------------------------------------
+# PARENT: one child process per configuration
+# -------------------------------------------------------------------
+def run_config(batch_size: int, window_ms: float, args: argparse.Namespace) -> Optional[Dict]:
+    env = dict(os.environ, WHISPER_BATCH_SIZE=str(batch_size), WHISPER_BATCH_WINDOW_MS=str(window_ms))
+    cmd = [
+        sys.executable, "-m", "bench.stt_batching", "--child",
+        "--fixture", args.fixture, "--callers", str(args.callers), "--rounds", str(args.rounds),
+    ]
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(f"💥 batch={batch_size} window={window_ms}ms falló:\n{proc.stderr[-2000:]}")
+        return None
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="STT throughput vs latency by batch size.")
+    parser.add_argument("--batch-sizes", default="1,4,8", help="Comma-separated WHISPER_BATCH_SIZE values")
+    parser.add_argument("--window-ms", default="20", help="Comma-separated WHISPER_BATCH_WINDOW_MS values")
+    parser.add_argument("--callers", type=int, default=8, help="Concurrent turns")
+    parser.add_argument("--rounds", type=int, default=3, help="Utterances per caller")
+    parser.add_argument("--fixture", default="short", help="Audio fixture in bench/fixtures")
+    parser.add_argument("--json", help="Write all results here")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return child(args)
+
+    results = {}
+    print(f"{'batch':>6} {'window':>7} {'single':>8} {'utt/s':>7} {'p50':>8} {'p95':>8} {'avg batch':>10}")
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        windows = [0.0] if batch_size == 1 else [float(w) for w in args.window_ms.split(",")]
+        for window_ms in windows:
+            r = run_config(batch_size, window_ms, args)
+            if r is None:
+                continue
+            results[f"{batch_size}@{window_ms:g}ms"] = r
+            print(
+                f"{batch_size:>6} {window_ms:>5g}ms {r['singleP50']:>6.0f}ms {r['utterancesPerS']:>7} "
+                f"{r['p50']:>6.0f}ms {r['p95']:>6.0f}ms {r['avgBatch']:>10}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+Local stand-ins for the Gemini, ElevenLabs and Supabase HTTP APIs.
+
+Point the backend at this server to benchmark the whole stack offline:
+
+    python -m bench.stub_servers --port 9000 --gemini-ms 600 --tts-ms 400 --db-ms 40
+
+    GEMINI_API_ENDPOINT=http://127.0.0.1:9000 \
+    ELEVENLABS_API_BASE=http://127.0.0.1:9000 \
+    SUPABASE_URL=http://127.0.0.1:9000 \
+    uvicorn app.main:app
+
+Whisper and BETO still run locally, so the numbers include the real CPU work.
+"""
+
+# All comments in English.
+
+import argparse
+import asyncio
+import json
+import random
+import uuid
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# First phone number of the generated fake leads (test_ws.py uses the same base)
+PHONE_BASE = 3000000000
+
+# One silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz, ~26 ms of audio)
+_SILENT_MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+# Approximate payload bytes per second of speech for ElevenLabs output formats
+_BYTES_PER_SECOND = {
+    "mp3_44100_128": 16000,
+    "mp3_22050_32": 4000,
+    "opus_48000_32": 4000,
+    "opus_48000_64": 8000,
+    "opus_48000_96": 12000,
+    "pcm_16000": 32000,
+}
+
+
+class StubSettings:
+    """Latency knobs shared by all stub routes (milliseconds)."""
+
+    def __init__(
+        self,
+        gemini_ms: float = 600.0,
+        tts_ms: float = 400.0,
+        db_ms: float = 40.0,
+        jitter: float = 0.2,
+        leads: int = 1000,
+    ):
+        self.gemini_ms = gemini_ms
+        self.tts_ms = tts_ms
+        self.db_ms = db_ms
+        self.jitter = jitter
+        self.leads = leads
+
+
+def make_leads(count: int) -> List[Dict]:
+    """Build deterministic fake leads: phone PHONE_BASE + i, stable UUIDs."""
+    leads = []
+    for i in range(count):
+        leads.append({
+            "id": str(uuid.uuid5(uuid.NAMESPACE_OID, f"stub-lead-{i}")),
+            "name": f"Cliente {i}",
+            "phone_number": PHONE_BASE + i,
+            "car_model": "2022",
+            "car_name": "Mazda CX-30",
+            "car_price_cop": 95_000_000,
+            "last_call_status": "PENDING",
+            "last_contact_at": None,
+        })
+    return leads
+
+
+def _parse_filters(params) -> Dict[str, List[str]]:
+    """Extract PostgREST `col=eq.value` / `col=in.(a,b)` filters as allowed values."""
+    filters = {}
+    for key, value in params.items():
+        if key in ("select", "limit", "order", "offset"):
+            continue
+        if value.startswith("eq."):
+            filters[key] = [value[3:]]
+        elif value.startswith("in.(") and value.endswith(")"):
+            filters[key] = [v.strip().strip('"') for v in value[4:-1].split(",")]
+    return filters
+
+
+def _matches(row: Dict, filters: Dict[str, List[str]]) -> bool:
+    return all(str(row.get(col)) in values for col, values in filters.items())
+
+
+def create_app(settings: StubSettings) -> FastAPI:
+    """Create one FastAPI app that answers all three upstream APIs."""
+    app = FastAPI(title="Domu upstream stubs")
+    leads = make_leads(settings.leads)
+    extra_tables: Dict[str, List[Dict]] = {}
+
+    async def delay(base_ms: float) -> None:
+        if base_ms <= 0:
+            return
+        spread = base_ms * settings.jitter
+        await asyncio.sleep(max(0.0, random.uniform(base_ms - spread, base_ms + spread)) / 1000.0)
+
+    def table_rows(table: str) -> List[Dict]:
+        if table == "Lead":
+            return leads
+        return extra_tables.setdefault(table, [])
+
+    # ---------- Supabase (PostgREST) ----------
+    @app.get("/rest/v1/{table}")
+    async def pg_select(table: str, request: Request):
+        await delay(settings.db_ms)
+        filters = _parse_filters(request.query_params)
+        rows = [r for r in table_rows(table) if _matches(r, filters)]
+        limit = request.query_params.get("limit")
+        if limit:
+            rows = rows[: int(limit)]
+
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(rows) != 1:
+                return JSONResponse(
+                    {
+                        "code": "PGRST116",
+                        "details": f"The result contains {len(rows)} rows",
+                        "hint": None,
+                        "message": "JSON object requested, multiple (or no) rows returned",
+                    },
+                    status_code=406,
+                )
+            return JSONResponse(rows[0])
+        return JSONResponse(rows)
+
+    @app.post("/rest/v1/{table}")
+    async def pg_insert(table: str, request: Request):
+        await delay(settings.db_ms)
+        body = await request.json()
+        new_rows = body if isinstance(body, list) else [body]
+        table_rows(table).extend(new_rows)
+        return JSONResponse(new_rows, status_code=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def pg_update(table: str, request: Request):
+        await delay(settings.db_ms)
+        body = await request.json()
+        filters = _parse_filters(request.query_params)
+        updated = []
+        for row in table_rows(table):
+            if _matches(row, filters):
+                row.update(body)
+                updated.append(row)
+        return JSONResponse(updated)
+
+    # ---------- Gemini (generateContent) ----------
+    @app.post("/v1beta/models/{model_action:path}")
+    async def gemini_generate(model_action: str, request: Request):
+        await delay(settings.gemini_ms)
+        text = "Perfecto, te recomiendo el plan Intermedia. ¿Te queda bien el sábado en la Sede Norte?"
+        payload = {
+            "candidates": [{
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": 0, "totalTokenCount": 0},
+        }
+        if "streamGenerateContent" in model_action:
+            # REST streaming is a JSON array of chunks (or SSE when alt=sse)
+            if request.query_params.get("alt") == "sse":
+                return Response(f"data: {json.dumps(payload)}\n\n", media_type="text/event-stream")
+            return JSONResponse([payload])
+        return JSONResponse(payload)
+
+    # ---------- ElevenLabs (text-to-speech) ----------
+    @app.post("/v1/text-to-speech/{voice_id:path}")
+    async def tts(voice_id: str, request: Request):
+        body = await request.json()
+        text = body.get("text", "")
+        output_format = request.query_params.get("output_format", "mp3_44100_128")
+        # Roughly 60 ms of speech per character, like a real voice
+        seconds = max(0.1, len(text) * 0.06)
+        if output_format == "mp3_44100_128":
+            audio = _SILENT_MP3_FRAME * int(seconds * 1000 / 26)
+        else:
+            audio = b"\x00" * int(seconds * _BYTES_PER_SECOND.get(output_format, 16000))
+
+        if not voice_id.endswith("/stream"):
+            await delay(settings.tts_ms)
+            return Response(audio, media_type="application/octet-stream")
+
+        # Streaming endpoint: headers now, audio spread over the latency budget
+        async def chunks():
+            parts = 8
+            step = max(1, len(audio) // parts)
+            for i in range(0, len(audio), step):
+                await delay(settings.tts_ms / parts)
+                yield audio[i:i + step]
+
+        return StreamingResponse(chunks(), media_type="application/octet-stream")
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run local Gemini/ElevenLabs/Supabase stubs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--gemini-ms", type=float, default=600.0, help="Mean Gemini latency")
+    parser.add_argument("--tts-ms", type=float, default=400.0, help="Mean ElevenLabs latency")
+    parser.add_argument("--db-ms", type=float, default=40.0, help="Mean Supabase latency")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative latency jitter (0.2 = ±20%%)")
+    parser.add_argument("--leads", type=int, default=1000, help="Number of fake leads to serve")
+    args = parser.parse_args(argv)
+
+    settings = StubSettings(
+        gemini_ms=args.gemini_ms,
+        tts_ms=args.tts_ms,
+        db_ms=args.db_ms,
+        jitter=args.jitter,
+        leads=args.leads,
+    )
+    print(f"🧪 Stubs on http://{args.host}:{args.port} "
+          f"(gemini={args.gemini_ms}ms, tts={args.tts_ms}ms, db={args.db_ms}ms, leads={args.leads})")
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+-- ConversationTurn: one row per answered turn of a real lead, written in
+-- batches by app/persistence.py (TURNS_TABLE). Run once in the Supabase SQL
+-- editor. lead_id must have the same type as "Lead".id (uuid here).
+
+create table if not exists "ConversationTurn" (
+    id          bigint generated by default as identity primary key,
+    lead_id     uuid not null references "Lead" (id) on delete cascade,
+    user_text   text not null default '',
+    agent_text  text not null default '',
+    intent      text,
+    created_at  timestamptz not null default now()
+);
+
+-- Transcript of one lead in order
+create index if not exists conversation_turn_lead_created_idx
+    on "ConversationTurn" (lead_id, created_at);
@@ -1,5 +1,17 @@
 import { useState, useRef, useEffect } from "react";
 
+// Pick a TTS output format that fits the caller's link; the backend
+// synthesizes (or transcodes) replies in this format.
+const pickAudioFormat = () => {
+  const conn = navigator.connection;
+  const slow =
+    conn &&
+    (conn.saveData || ["slow-2g", "2g", "3g"].includes(conn.effectiveType));
+  if (!slow) return "mp3";
+  const probe = document.createElement("audio");
+  return probe.canPlayType('audio/ogg; codecs="opus"') ? "opus_32" : "mp3_32";
+};
+
 function App() {
   const [recording, setRecording] = useState(false);
   const [loading, setLoading] = useState(false);
@@ -15,6 +27,8 @@ function App() {
   const mediaRecorderRef = useRef(null);
   const chunksRef = useRef([]);
   const audioRef = useRef(null); // reference to audio element
+  const wsRef = useRef(null); // call socket, reused across turns
+  const resumeTokenRef = useRef(null); // lets a dropped socket reattach
 
   // Helper to stop agent audio if playing
   const stopAgentAudioIfPlaying = () => {
@@ -40,7 +54,9 @@ function App() {
 
     try {
       const res = await fetch(
-        `http://localhost:8000/intro?phone=${encodeURIComponent(phone.trim())}`
+        `http://localhost:8000/intro?phone=${encodeURIComponent(
+          phone.trim()
+        )}&format=${pickAudioFormat()}`
       );
       if (!res.ok) {
         throw new Error("Intro request failed");
@@ -49,6 +65,9 @@ function App() {
 
       setLeadId(data.leadId);
       setLeadName(data.leadName);
+      // New call, new session: the open socket is bound to the previous lead
+      hangUp();
+      resumeTokenRef.current = null;
 
       setLastReply({
         type: "reply",
@@ -68,64 +87,142 @@ function App() {
     }
   };
 
-  // ---------- Send audio blob to backend ----------
-  const sendBlobToAgent = async (blob) => {
-    setLoading(true);
-    setError(null);
-    setLastReply((prev) => prev); // keep intro visible until new reply
-
+  // ---------- Long-lived call socket ----------
+  // One WebSocket per call; if it drops we reattach with the resume token
+  // so the backend keeps the cached lead and prompt for this call.
+  const handleWsMessage = (event) => {
+    let data;
     try {
-      const arrayBuffer = await blob.arrayBuffer();
+      data = JSON.parse(event.data);
+    } catch (err) {
+      console.error("Invalid JSON from WS:", err);
+      setError("Respuesta inválida del backend.");
+      setLoading(false);
+      return;
+    }
+
+    if (data.type === "session") {
+      resumeTokenRef.current = data.resumeToken;
+      return;
+    }
+    if (["pong", "format", "interrupted"].includes(data.type)) return;
+
+    if (data.type === "error" && data.code === "resume_expired") {
+      // The old call is gone; the next send opens a new one for this lead
+      resumeTokenRef.current = null;
+    }
+
+    if (data.type === "busy") {
+      setError(
+        `El servidor está ocupado, intenta de nuevo en ${data.retryAfter} s.`
+      );
+    } else if (data.type === "error") {
+      setError(data.detail || data.message || "Error en el backend.");
+    } else if (data.noSpeech) {
+      setError("No se detectó voz en el audio, intenta de nuevo.");
+    } else {
+      setLastReply(data);
+    }
+    setLoading(false);
+  };
+
+  const ensureSocket = () =>
+    new Promise((resolve, reject) => {
+      const current = wsRef.current;
+      if (current && current.readyState === WebSocket.OPEN) {
+        resolve(current);
+        return;
+      }
+      if (current && current.readyState === WebSocket.CONNECTING) {
+        current.addEventListener("open", () => resolve(current), { once: true });
+        current.addEventListener("error", reject, { once: true });
+        return;
+      }
+
+      const params = new URLSearchParams({ format: pickAudioFormat() });
+      // lead_id always goes along, so the call never falls back to another lead
+      if (leadId) {
+        params.set("lead_id", leadId);
+      }
+      if (resumeTokenRef.current) {
+        params.set("resume", resumeTokenRef.current);
+      }
       const ws = new WebSocket(
-        `ws://localhost:8000/ws/voice${leadId ? `?lead_id=${leadId}` : ""}`
+        `ws://localhost:8000/ws/voice?${params.toString()}`
       );
       ws.binaryType = "arraybuffer";
+      wsRef.current = ws;
+      setWsStatus("connecting");
 
       ws.onopen = () => {
         setWsStatus("connected");
-        ws.send(arrayBuffer);
+        resolve(ws);
       };
 
       ws.onerror = (e) => {
         console.error("WS error", e);
-        setError("Error en la conexión WebSocket.");
         setWsStatus("error");
-        setLoading(false);
+        reject(e);
       };
 
-      ws.onmessage = (event) => {
-        try {
-          const data = JSON.parse(event.data);
-          if (data.type === "error") {
-            setError(data.detail || data.message || "Error en el backend.");
-          } else {
-            setLastReply(data);
-          }
-        } catch (err) {
-          console.error("Invalid JSON from WS:", err);
-          setError("Respuesta inválida del backend.");
-        } finally {
-          setLoading(false);
-          ws.close();
-          setWsStatus("disconnected");
-        }
+      ws.onclose = () => {
+        if (wsRef.current === ws) wsRef.current = null;
+        setWsStatus("disconnected");
+        setLoading(false);
       };
+
+      ws.onmessage = handleWsMessage;
+    });
+
+  // End the call on the backend and drop the socket
+  const hangUp = () => {
+    const ws = wsRef.current;
+    wsRef.current = null;
+    if (!ws) return;
+    if (ws.readyState === WebSocket.OPEN) {
+      ws.send(JSON.stringify({ type: "end" }));
+    }
+    ws.close();
+  };
+
+  // Close the call socket when the page goes away
+  useEffect(() => {
+    return () => hangUp();
+  }, []);
+
+  // ---------- Send audio blob to backend ----------
+  const sendBlobToAgent = async (blob) => {
+    setLoading(true);
+    setError(null);
+    setLastReply((prev) => prev); // keep intro visible until new reply
+
+    try {
+      const arrayBuffer = await blob.arrayBuffer();
+      const ws = await ensureSocket();
+      ws.send(arrayBuffer);
     } catch (err) {
       console.error(err);
-      setError("Error preparando el audio para enviar.");
+      setError("Error en la conexión WebSocket.");
       setLoading(false);
     }
   };
 
   // ---------- Push-to-talk recording ----------
   const startRecording = async () => {
-    if (recording || loading) return;
+    if (recording) return;
     try {
       setError(null);
 
       // ⛔ DETENER AUDIO DEL AGENTE SI ESTÁ HABLANDO
       stopAgentAudioIfPlaying();
 
+      // Barge-in: tell the backend to drop the reply it is still preparing
+      const ws = wsRef.current;
+      if (loading && ws && ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ type: "interrupt" }));
+        setLoading(false);
+      }
+
       const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
       const mimeType = "audio/webm;codecs=opus";
       const mr = new MediaRecorder(stream, { mimeType });
@@ -183,7 +280,7 @@ function App() {
       if (e.code === "Space" || e.key === " ") {
         e.preventDefault();
         // Avoid retrigger when held
-        if (!recording && !loading && hasPlayedIntro) {
+        if (!recording && hasPlayedIntro) {
           startRecording();
         }
       }
@@ -352,13 +449,13 @@ function App() {
             onMouseLeave={recording ? handlePressEnd : undefined}
             onTouchStart={handlePressStart}
             onTouchEnd={handlePressEnd}
-            disabled={loading || !hasPlayedIntro}
+            disabled={!hasPlayedIntro}
             style={{
               padding: "1rem 2.5rem",
               borderRadius: "999px",
               border: "none",
               background:
-                !hasPlayedIntro || loading
+                !hasPlayedIntro
                   ? "#1F2937"
                   : recording
                   ? "#DC2626"
@@ -372,7 +469,7 @@ function App() {
               color: "white",
               fontWeight: 700,
               fontSize: "1.1rem",
-              cursor: loading || !hasPlayedIntro ? "not-allowed" : "pointer",
+              cursor: !hasPlayedIntro ? "not-allowed" : "pointer",
               transition:
                 "transform 0.1s ease, box-shadow 0.1s ease, background 0.1s",
             }}
@@ -1,14 +1,15 @@
-import asyncio
-import io
-import json
-import wave
-
 import av
-import numpy as np
 import streamlit as st
-import websockets
 from streamlit_webrtc import webrtc_streamer, WebRtcMode, RTCConfiguration
 
+from streamlit_audio import (
+    BackendClient,
+    ChunkStreamer,
+    PCMRingBuffer,
+    frame_to_mono_int16,
+    to_upload_wav,
+)
+
 st.set_page_config(page_title="Domu Voice Agent", page_icon="🎙️")
 
 # ----------- WebRTC config -----------
@@ -16,58 +17,45 @@ RTC_CONFIGURATION = RTCConfiguration(
     {"iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]}
 )
 
-# Global buffer to store audio frames (PCM16 chunks)
-# Global buffer to store audio frames (PCM16 chunks)
-# We create it only once, even if Streamlit reruns the script.
-try:
-    captured_frames
-except NameError:
-    captured_frames = []
-
-
-# ----------- WebSocket call to backend -----------
-async def send_audio_ws(audio_bytes: bytes):
-    """Send WAV bytes to the WebSocket backend and return JSON reply."""
-    uri = "ws://localhost:8000/ws/voice"
-    async with websockets.connect(uri) as ws:
-        await ws.send(audio_bytes)
-        msg = await ws.recv()
-        data = json.loads(msg)
-        return data
-
-
-def frames_to_wav_bytes(frames, sample_rate: int = 48000) -> bytes:
-    """Convert a list of PCM16 mono chunks to a valid WAV file in memory."""
-    pcm = b"".join(frames)
-    buf = io.BytesIO()
-    with wave.open(buf, "wb") as wf:
-        wf.setnchannels(1)       # mono
-        wf.setsampwidth(2)       # 2 bytes = int16
-        wf.setframerate(sample_rate)
-        wf.writeframes(pcm)
-    return buf.getvalue()
+BACKEND_WS_URI = "ws://localhost:8000/ws/voice"
+
+
+# ----------- Shared capture state -----------
+# cache_resource keeps these alive across Streamlit reruns and shares them
+# with the WebRTC audio thread.
+@st.cache_resource
+def get_ring_buffer() -> PCMRingBuffer:
+    """Preallocated int16 mono buffer (2 minutes at 48 kHz)."""
+    return PCMRingBuffer(seconds=120.0, sample_rate=48000)
+
+
+@st.cache_resource
+def get_backend_client() -> BackendClient:
+    """One persistent WebSocket to the backend for the whole call."""
+    return BackendClient(BACKEND_WS_URI)
+
+
+@st.cache_resource
+def get_streamer() -> ChunkStreamer:
+    return ChunkStreamer(get_backend_client())
+
+
+ring = get_ring_buffer()
+client = get_backend_client()
+streamer = get_streamer()
 
 
 # ----------- Audio callback -----------
 def audio_frame_callback(frame: av.AudioFrame):
     """
     Called on each audio frame from WebRTC.
-    We store mono PCM16 bytes in a global buffer.
+    We downmix to mono int16 and write it into the ring buffer; in
+    streaming mode full chunks are sent to the backend right away.
     """
-    global captured_frames
-
-    # frame.to_ndarray() -> shape: (channels, samples)
-    data = frame.to_ndarray()
-    if data.ndim == 2:
-        mono = data.mean(axis=0)
-    else:
-        mono = data
-    pcm16 = mono.astype(np.int16).tobytes()
-
-    captured_frames.append(pcm16)
-    # Debug: see frames arriving in terminal
-    print("🎤 FRAME RECIBIDO, buffer len:", len(captured_frames))
-
+    ring.sample_rate = frame.sample_rate
+    ring.write(frame_to_mono_int16(frame))
+    if streamer.enabled:
+        streamer.pump(ring)
     return frame
 
 
@@ -93,32 +81,41 @@ if webrtc_ctx and webrtc_ctx.state.playing:
 else:
     st.info("Pulsa **Start** para comenzar a capturar audio.")
 
+streamer.enabled = st.checkbox(
+    "Enviar en streaming mientras hablas (16 kHz, por fragmentos)",
+    value=streamer.enabled,
+)
+
 
 st.subheader("🎧 Datos grabados")
 
-if captured_frames:
-    st.success(f"Se han capturado {len(captured_frames)} fragmentos de audio. Listo para enviar.")
+pending_s = len(ring) / ring.sample_rate
+if pending_s > 0 or streamer.enabled:
+    st.success(f"{pending_s:.1f}s de audio pendientes. Listo para enviar.")
 else:
     st.warning("No hay audio grabado aún.")
+st.caption(f"Bytes enviados al backend en esta sesión: {client.bytes_sent:,}")
 
 
 # ----------- Enviar al backend -----------
 if st.button("Enviar al agente 🚀"):
-    if not captured_frames:
+    with st.spinner("Procesando audio con el backend..."):
+        try:
+            if streamer.enabled:
+                data = streamer.finish(ring)
+            elif len(ring):
+                # Downsample to 16 kHz before upload (about 3x fewer bytes)
+                wav_bytes = to_upload_wav(ring.read(), ring.sample_rate)
+                data = client.send_utterance(wav_bytes)
+            else:
+                data = None
+        except Exception as e:
+            st.error(f"Error comunicando con backend: {e}")
+            st.stop()
+
+    if data is None:
         st.warning("No hay audio grabado aún.")
     else:
-        # Convert captured PCM16 frames to WAV
-        wav_bytes = frames_to_wav_bytes(captured_frames, sample_rate=48000)
-
-        with st.spinner("Procesando audio con el backend..."):
-            try:
-                data = asyncio.run(send_audio_ws(wav_bytes))
-            except Exception as e:
-                st.error(f"Error comunicando con backend: {e}")
-                st.stop()
-
-        # Limpiar buffer para el siguiente turno
-        captured_frames.clear()
         st.session_state.last_reply = data
 
 
@@ -129,6 +126,12 @@ if st.session_state.last_reply:
     if data.get("type") == "error":
         st.error("El backend devolvió un error:")
         st.code(data.get("detail", ""), language="text")
+    elif data.get("noSpeech"):
+        st.info("No se detectó voz en el audio, intenta de nuevo.")
+    elif data.get("type") == "busy":
+        st.warning(
+            f"El servidor está ocupado, intenta de nuevo en {data.get('retryAfter', 1)} s."
+        )
     else:
         st.subheader("🗣️ Transcripción del usuario")
         st.write(data.get("userText", ""))
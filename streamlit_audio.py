@@ -0,0 +1,274 @@
+"""
+Audio capture helpers for streamlit_app.py.
+
+- PCMRingBuffer: preallocated int16 ring buffer written from the WebRTC thread.
+- frame_to_mono_int16: vectorized downmix of an av.AudioFrame.
+- Downsampler: anti-aliased integer-factor decimation (48 kHz -> 16 kHz)
+  that keeps its filter state, so it works on streamed blocks too.
+- BackendClient: one persistent /ws/voice connection driven from a
+  background event loop, with whole-utterance and chunked-streaming sends.
+"""
+
+# All comments in English.
+
+import asyncio
+import json
+import threading
+from typing import Optional
+
+import numpy as np
+import websockets
+
+from app.utils import pcm16_to_wav_bytes
+
+TARGET_RATE = 16000  # what Whisper works at
+
+
+class PCMRingBuffer:
+    """Fixed-size int16 ring buffer; the oldest audio is overwritten when full."""
+
+    def __init__(self, seconds: float = 120.0, sample_rate: int = 48000):
+        self.sample_rate = sample_rate
+        self._buf = np.zeros(int(seconds * sample_rate), dtype=np.int16)
+        self._written = 0  # total samples ever written
+        self._read = 0  # total samples ever consumed
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return len(self._buf)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._written - self._read
+
+    def write(self, samples: np.ndarray) -> None:
+        cap = self.capacity
+        with self._lock:
+            n = len(samples)
+            if n > cap:
+                self.dropped += n - cap
+                samples = samples[-cap:]
+                n = cap
+
+            start = self._written % cap
+            first = min(n, cap - start)
+            self._buf[start:start + first] = samples[:first]
+            self._buf[:n - first] = samples[first:]
+            self._written += n
+
+            overflow = self._written - self._read - cap
+            if overflow > 0:
+                self.dropped += overflow
+                self._read += overflow
+
+    def read(self, max_samples: Optional[int] = None) -> np.ndarray:
+        """Copy out and consume up to max_samples unread samples (all by default)."""
+        cap = self.capacity
+        with self._lock:
+            n = self._written - self._read
+            if max_samples is not None:
+                n = min(n, max_samples)
+            start = self._read % cap
+            first = min(n, cap - start)
+            out = np.empty(n, dtype=np.int16)
+            out[:first] = self._buf[start:start + first]
+            out[first:] = self._buf[:n - first]
+            self._read += n
+            return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._read = self._written
+
+
+def frame_to_mono_int16(frame) -> np.ndarray:
+    """Downmix an av.AudioFrame to mono int16 without per-sample Python work."""
+    data = frame.to_ndarray()
+    channels = len(frame.layout.channels)
+
+    if data.dtype.kind == "f":
+        data = np.clip(data * 32767.0, -32768, 32767)
+
+    if frame.format.is_planar:
+        # shape (channels, samples)
+        if channels == 1:
+            return data[0].astype(np.int16, copy=False)
+        return (data.astype(np.int32).sum(axis=0) // channels).astype(np.int16)
+
+    # Packed formats come as (1, samples * channels), interleaved
+    if channels == 1:
+        return data.reshape(-1).astype(np.int16, copy=False)
+    interleaved = data.reshape(-1, channels).astype(np.int32)
+    return (interleaved.sum(axis=1) // channels).astype(np.int16)
+
+
+class Downsampler:
+    """
+    Windowed-sinc low-pass + integer decimation. Only the kept output
+    samples are computed, and history/phase carry over between blocks.
+    Rates that are not a multiple of 16 kHz pass through unchanged.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int = TARGET_RATE, taps: int = 63):
+        if in_rate % out_rate == 0:
+            self.factor = in_rate // out_rate
+            self.out_rate = out_rate
+        else:
+            self.factor = 1
+            self.out_rate = in_rate
+
+        self._taps = taps
+        n = np.arange(taps) - (taps - 1) / 2.0
+        cutoff = 0.45 / self.factor  # a bit below the new Nyquist
+        h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+        self._h = (h / h.sum()).astype(np.float32)[::-1].copy()
+        self._history = np.zeros(taps - 1, dtype=np.float32)
+        self._phase = 0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self.factor == 1 or len(block) == 0:
+            return block.astype(np.int16, copy=False)
+
+        x = np.concatenate([self._history, block.astype(np.float32)])
+        windows = np.lib.stride_tricks.sliding_window_view(x, self._taps)
+        out = windows[self._phase::self.factor] @ self._h
+
+        self._history = x[-(self._taps - 1):]
+        self._phase = (self._phase - len(block)) % self.factor
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+
+def to_upload_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    """Resample a whole utterance to 16 kHz (when possible) and wrap it as WAV."""
+    ds = Downsampler(sample_rate)
+    return pcm16_to_wav_bytes(ds.process(samples).tobytes(), ds.out_rate)
+
+
+class BackendClient:
+    """Persistent /ws/voice connection owned by a background event loop."""
+
+    def __init__(self, uri: str = "ws://localhost:8000/ws/voice"):
+        self.uri = uri
+        self.resume_token: Optional[str] = None
+        self.bytes_sent = 0
+        self._ws = None
+        self._send_lock = asyncio.Lock()  # keeps chunks in order across tasks
+        # audio_start of the chunked utterance in progress, if any
+        self._stream_start: Optional[str] = None
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+
+    def _call(self, coro, timeout: Optional[float] = None):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    async def _connect(self):
+        uri = self.uri + (f"?resume={self.resume_token}" if self.resume_token else "")
+        self._ws = await websockets.connect(uri, max_size=None)
+        hello = json.loads(await self._ws.recv())
+        if hello.get("type") == "session":
+            self.resume_token = hello.get("resumeToken")
+        elif hello.get("code") == "resume_expired" and self.resume_token:
+            # The old call is gone: start a new one instead of resuming
+            self.resume_token = None
+            await self._connect()
+
+    async def _send(self, payload) -> None:
+        async with self._send_lock:
+            # Reconnect (resuming the session) once if the socket dropped
+            for attempt in range(2):
+                try:
+                    if self._ws is None:
+                        await self._connect()
+                        if self._stream_start is not None and payload != self._stream_start:
+                            # The new socket has no stream open: without this the
+                            # server would take each PCM chunk as a .webm utterance
+                            await self._ws.send(self._stream_start)
+                    await self._ws.send(payload)
+                    if isinstance(payload, (bytes, bytearray)):
+                        self.bytes_sent += len(payload)
+                    return
+                except websockets.ConnectionClosed:
+                    self._ws = None
+                    if attempt:
+                        raise
+
+    async def _recv_reply(self) -> dict:
+        while True:
+            data = json.loads(await self._ws.recv())
+            # busy: the turn was shed, nothing else will come for it
+            if data.get("type") in ("reply", "error", "busy"):
+                return data
+
+    async def _send_utterance(self, wav_bytes: bytes) -> dict:
+        await self._send(wav_bytes)
+        return await self._recv_reply()
+
+    def send_utterance(self, wav_bytes: bytes, timeout: float = 120.0) -> dict:
+        """Send one complete utterance and wait for the agent reply."""
+        return self._call(self._send_utterance(wav_bytes), timeout)
+
+    # ---------- Chunked streaming ----------
+    def stream_start(self, sample_rate: int) -> None:
+        """Open a chunked utterance without blocking the caller (audio thread)."""
+        start = json.dumps({"type": "audio_start", "sampleRate": sample_rate})
+        asyncio.run_coroutine_threadsafe(self._stream_open(start), self._loop)
+
+    async def _stream_open(self, start: str) -> None:
+        self._stream_start = start
+        await self._send(start)
+
+    def stream_chunk(self, pcm16: bytes) -> None:
+        """Queue a PCM16 chunk without blocking the caller (audio thread)."""
+        asyncio.run_coroutine_threadsafe(self._send(pcm16), self._loop)
+
+    async def _stream_end(self) -> dict:
+        try:
+            await self._send(json.dumps({"type": "audio_end"}))
+        finally:
+            self._stream_start = None
+        return await self._recv_reply()
+
+    def stream_end(self, timeout: float = 120.0) -> dict:
+        return self._call(self._stream_end(), timeout)
+
+
+class ChunkStreamer:
+    """
+    Drains the ring buffer in ~chunk_ms blocks, downsamples them and
+    streams them to the backend while the user is still talking.
+    """
+
+    def __init__(self, client: BackendClient, chunk_ms: int = 250):
+        self.client = client
+        self.chunk_ms = chunk_ms
+        self.enabled = False
+        self._downsampler: Optional[Downsampler] = None
+        self._lock = threading.Lock()
+
+    def _send_block(self, block: np.ndarray, sample_rate: int) -> None:
+        if self._downsampler is None:
+            self._downsampler = Downsampler(sample_rate)
+            self.client.stream_start(self._downsampler.out_rate)
+        pcm = self._downsampler.process(block)
+        if len(pcm):
+            self.client.stream_chunk(pcm.tobytes())
+
+    def pump(self, ring: PCMRingBuffer) -> None:
+        """Called from the audio thread after each frame."""
+        chunk = int(ring.sample_rate * self.chunk_ms / 1000)
+        with self._lock:
+            while self.enabled and len(ring) >= chunk:
+                self._send_block(ring.read(chunk), ring.sample_rate)
+
+    def finish(self, ring: PCMRingBuffer) -> Optional[dict]:
+        """Flush what is left, close the utterance and wait for the reply."""
+        with self._lock:
+            rest = ring.read()
+            if len(rest):
+                self._send_block(rest, ring.sample_rate)
+            if self._downsampler is None:
+                return None
+            self._downsampler = None
+        return self.client.stream_end()
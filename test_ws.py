@@ -1,37 +1,234 @@
 # comments in English only
 
+"""
+WebSocket load generator for the voice backend.
+
+Each simulated caller hits /intro, opens /ws/voice for its lead and sends
+the same audio file for a number of turns with think time in between.
+With the defaults (1 caller, 1 turn) it behaves like the old smoke test.
+
+Examples:
+    python test_ws.py                                   # single call, print reply
+    python test_ws.py --callers 50 --ramp 5 --turns 4 --think 2
+
+Run against bench/stub_servers.py to benchmark offline (see its docstring).
+"""
+
+import argparse
 import asyncio
 import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
 import websockets
 
 AUDIO_FILE = "test.webm"  # path to your test audio file
+PHONE_BASE = 3000000000  # same base as the fake leads in bench/stub_servers.py
+
+
+class Stats:
+    """Latency samples and error counts per operation."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.audio_bytes = 0
+
+    def add(self, op: str, ms: float) -> None:
+        self.samples.setdefault(op, []).append(ms)
+
+    def error(self, op: str) -> None:
+        self.errors[op] = self.errors.get(op, 0) + 1
+
+    def summary(self, wall_s: float) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for op in sorted(set(self.samples) | set(self.errors)):
+            values = sorted(self.samples.get(op, []))
+            out[op] = {
+                "count": len(values),
+                "errors": self.errors.get(op, 0),
+                "throughput_per_s": len(values) / wall_s if wall_s > 0 else 0.0,
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "p99_ms": percentile(values, 99),
+                "max_ms": values[-1] if values else 0.0,
+            }
+        return out
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def recv_reply(ws) -> dict:
+    """Wait for the next reply/error/busy message, skipping control messages."""
+    while True:
+        data = json.loads(await ws.recv())
+        if data.get("type") in ("reply", "error", "busy"):
+            return data
+
+
+async def fetch_audio(url: str, args, stats: Stats, pool: ThreadPoolExecutor) -> None:
+    """Download a reply's audio like a player would and count its bytes."""
+    loop = asyncio.get_running_loop()
+    t0 = time.perf_counter()
+    try:
+        res = await loop.run_in_executor(pool, lambda: requests.get(url, timeout=args.timeout))
+        res.raise_for_status()
+        stats.add("audio", (time.perf_counter() - t0) * 1000.0)
+        stats.audio_bytes += len(res.content)
+    except Exception:
+        stats.error("audio")
+
+
+async def run_caller(idx: int, args, audio_bytes: bytes, stats: Stats, pool: ThreadPoolExecutor) -> None:
+    """One simulated call: intro, then N turns over a single WebSocket."""
+    loop = asyncio.get_running_loop()
+    lead_id: Optional[str] = None
+
+    if not args.skip_intro:
+        phone = str(args.phone_base + (idx % args.leads))
+        t0 = time.perf_counter()
+        try:
+            res = await loop.run_in_executor(
+                pool,
+                lambda: requests.get(
+                    f"{args.http_url}/intro",
+                    params={"phone": phone, "format": args.format},
+                    timeout=args.timeout,
+                ),
+            )
+            if res.status_code == 503:
+                # Shed by admission control: the whole call is turned away
+                stats.error("shed")
+                if args.verbose:
+                    print(f"[caller {idx}] intro shed, Retry-After {res.headers.get('Retry-After')}s")
+                return
+            res.raise_for_status()
+            stats.add("intro", (time.perf_counter() - t0) * 1000.0)
+            lead_id = res.json().get("leadId")
+        except Exception as e:
+            stats.error("intro")
+            if args.verbose:
+                print(f"[caller {idx}] intro failed: {e}")
+
+    uri = f"{args.ws_url}/ws/voice?format={args.format}" + (f"&lead_id={lead_id}" if lead_id else "")
+    if args.profile:
+        uri += "&profile=1"
+    try:
+        async with websockets.connect(uri, max_size=None) as ws:
+            for turn in range(args.turns):
+                if turn and args.think > 0:
+                    await asyncio.sleep(random.uniform(0.5, 1.5) * args.think)
+
+                # A few trailing bytes make every turn unique (decoders ignore
+                # them); identical bytes would be served from the turn cache
+                t0 = time.perf_counter()
+                await ws.send(audio_bytes + os.urandom(8))
+                data = await asyncio.wait_for(recv_reply(ws), timeout=args.timeout)
+                ms = (time.perf_counter() - t0) * 1000.0
+
+                if data.get("type") == "busy":
+                    stats.error("shed")
+                    if data.get("scope") == "sessions":
+                        break  # server closes the socket after a session-level reject
+                    continue
+                if data.get("type") == "error":
+                    stats.error("reply")
+                else:
+                    stats.add("reply", ms)
+                    if args.fetch_audio and data.get("audioUrl"):
+                        await fetch_audio(data["audioUrl"], args, stats, pool)
+
+                if args.callers == 1 and args.turns == 1:
+                    print("\n--- Backend reply ---")
+                    print("User text:", data.get("userText"))
+                    print("Intent:", data.get("intent"))
+                    print("Reply text:", data.get("replyText"))
+                    print("Audio URL:", data.get("audioUrl"))
+                elif args.verbose:
+                    print(f"[caller {idx}] turn {turn + 1}: {ms:.0f}ms {data.get('type')}")
+    except Exception as e:
+        stats.error("reply")
+        if args.verbose:
+            print(f"[caller {idx}] websocket failed: {e}")
+
+
+async def main(args) -> None:
+    # 1) Read local audio file as bytes
+    with open(args.audio, "rb") as f:
+        audio_bytes = f.read()
+
+    stats = Stats()
+    pool = ThreadPoolExecutor(max_workers=max(4, args.callers))
+    tasks = []
+
+    print(f"🚀 {args.callers} callers, ramp {args.ramp}/s, {args.turns} turns, think {args.think}s")
+    t_start = time.perf_counter()
+
+    # 2) Ramp callers up at a fixed rate
+    for idx in range(args.callers):
+        tasks.append(asyncio.create_task(run_caller(idx, args, audio_bytes, stats, pool)))
+        if args.ramp > 0 and idx < args.callers - 1:
+            await asyncio.sleep(1.0 / args.ramp)
 
-async def main():
-    uri = "ws://localhost:8000/ws/voice"
+    await asyncio.gather(*tasks)
+    wall_s = time.perf_counter() - t_start
+    pool.shutdown(wait=False)
 
-    async with websockets.connect(uri) as ws:
-        print("Connected to WebSocket")
+    # 3) Report
+    summary = stats.summary(wall_s)
+    print(f"\n--- Load summary ({wall_s:.1f}s wall) ---")
+    for op, s in summary.items():
+        print(
+            f"{op:>6}: n={s['count']:<5} err={s['errors']:<4} "
+            f"{s['throughput_per_s']:.2f}/s  p50={s['p50_ms']:.0f}ms  "
+            f"p95={s['p95_ms']:.0f}ms  p99={s['p99_ms']:.0f}ms  max={s['max_ms']:.0f}ms"
+        )
 
-        # 1) Read local audio file as bytes
-        with open(AUDIO_FILE, "rb") as f:
-            audio_bytes = f.read()
+    if stats.audio_bytes:
+        n_audio = len(stats.samples.get("audio", []))
+        print(f"🔊 audio: {stats.audio_bytes:,} bytes total, {stats.audio_bytes / max(1, n_audio):,.0f} bytes/reply")
 
-        # 2) Send raw binary audio to the backend
-        await ws.send(audio_bytes)
-        print("Audio sent, waiting for reply...")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"wall_s": wall_s, "config": vars(args), "ops": summary, "audio_bytes": stats.audio_bytes},
+                f,
+                indent=2,
+            )
+        print("📄 Results written to", args.json)
 
-        # 3) Wait for JSON reply
-        msg = await ws.recv()
-        data = json.loads(msg)
 
-        print("\n--- Backend reply ---")
-        print("User text:", data.get("userText"))
-        print("Intent:", data.get("intent"))
-        print("Reply text:", data.get("replyText"))
-        print("Audio URL:", data.get("audioUrl"))
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load generator for /intro and /ws/voice.")
+    parser.add_argument("--http-url", default="http://localhost:8000")
+    parser.add_argument("--ws-url", default="ws://localhost:8000")
+    parser.add_argument("--audio", default=AUDIO_FILE, help="Audio file sent on every turn")
+    parser.add_argument("--callers", type=int, default=1, help="Number of concurrent simulated callers")
+    parser.add_argument("--ramp", type=float, default=0.0, help="New callers per second (0 = all at once)")
+    parser.add_argument("--turns", type=int, default=1, help="Turns per call")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean think time between turns (s)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout (s)")
+    parser.add_argument("--phone-base", type=int, default=PHONE_BASE)
+    parser.add_argument("--leads", type=int, default=1000, help="Callers cycle over this many phones")
+    parser.add_argument("--skip-intro", action="store_true", help="Go straight to /ws/voice (demo lead)")
+    parser.add_argument("--format", default="mp3", help="TTS output format to negotiate (e.g. opus_32)")
+    parser.add_argument("--fetch-audio", action="store_true", help="Download each reply's audio")
+    parser.add_argument("--profile", action="store_true", help="Ask the server to profile every turn")
+    parser.add_argument("--json", help="Write the summary to this JSON file")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
 
-        # 4) Optional: print full JSON
-        # print("Raw:", data)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,12 @@
+# All comments in English.
+import os
+import sys
+
+# app.config refuses to import without credentials; these never reach a network
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("ELEVENLABS_API_KEY", "test")
+os.environ.setdefault("ELEVENLABS_VOICE_ID", "test")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_ANON_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.c3R1Yg")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
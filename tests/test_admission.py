@@ -0,0 +1,132 @@
+# All comments in English.
+import asyncio
+
+import pytest
+
+from app.admission import AdmissionRejected, Limiter, Priority
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_admits_up_to_limit_without_waiting():
+    async def scenario():
+        limiter = Limiter("t", limit=2, queue_size=0, max_wait_s=0.1)
+        await limiter.acquire()
+        await limiter.acquire()
+        assert limiter.active == 2
+        with pytest.raises(AdmissionRejected) as exc:
+            await limiter.acquire()
+        assert exc.value.limiter == "t"
+        assert exc.value.retry_after >= 1
+
+    run(scenario())
+
+
+def test_live_waiters_are_served_before_prewarm():
+    async def scenario():
+        limiter = Limiter("t", limit=1, queue_size=4, max_wait_s=1.0)
+        await limiter.acquire()
+        order = []
+
+        async def waiter(name, priority):
+            await limiter.acquire(priority)
+            order.append(name)
+
+        tasks = [
+            asyncio.create_task(waiter("prewarm", Priority.PREWARM)),
+            asyncio.create_task(waiter("live", Priority.LIVE)),
+        ]
+        await asyncio.sleep(0.01)  # both queued
+        limiter.release()
+        await asyncio.sleep(0.01)
+        assert order == ["live"]
+        limiter.release()
+        await asyncio.gather(*tasks)
+        assert order == ["live", "prewarm"]
+
+    run(scenario())
+
+
+def test_live_request_evicts_prewarm_from_a_full_queue():
+    async def scenario():
+        limiter = Limiter("t", limit=1, queue_size=1, max_wait_s=1.0)
+        await limiter.acquire()
+        prewarm = asyncio.create_task(limiter.acquire(Priority.PREWARM))
+        await asyncio.sleep(0.01)
+        live = asyncio.create_task(limiter.acquire(Priority.LIVE))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(AdmissionRejected):
+            await prewarm
+        limiter.release()
+        await live
+        assert limiter.active == 1
+
+    run(scenario())
+
+
+def test_prewarm_does_not_evict_live():
+    async def scenario():
+        limiter = Limiter("t", limit=1, queue_size=1, max_wait_s=1.0)
+        await limiter.acquire()
+        live = asyncio.create_task(limiter.acquire(Priority.LIVE))
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire(Priority.PREWARM)
+        limiter.release()
+        await live
+
+    run(scenario())
+
+
+def test_waiter_is_rejected_after_max_wait():
+    async def scenario():
+        limiter = Limiter("t", limit=1, queue_size=1, max_wait_s=0.05)
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()
+        assert limiter.waiting == 0
+        assert limiter.rejected == 1
+        # The timed-out waiter must not take the slot when it frees up
+        limiter.release()
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        limiter = Limiter("t", limit=1, queue_size=1, max_wait_s=1.0)
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert limiter.waiting == 1
+
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert limiter.waiting == 0
+
+        # Its queue place is free again, and releasing does not leak a slot to it
+        other = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        limiter.release()
+        await other
+        assert limiter.active == 1
+
+    run(scenario())
+
+
+def test_slot_releases_on_error():
+    async def scenario():
+        limiter = Limiter("t", limit=1, queue_size=0, max_wait_s=0.1)
+        with pytest.raises(RuntimeError):
+            async with limiter.slot():
+                assert limiter.active == 1
+                raise RuntimeError("boom")
+        assert limiter.active == 0
+        assert limiter.stats()["admitted"] == 1
+
+    run(scenario())
@@ -0,0 +1,91 @@
+# All comments in English.
+import os
+
+import numpy as np
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from app import audio_formats
+from app.audio_formats import content_filename, digest_from_filename, encode_pcm, resolve_format
+from app.audio_serving import IMMUTABLE_CACHE, REVALIDATE_CACHE, AudioFiles
+
+DIGEST = "0123456789abcdef" * 4
+UUID_HEX = "fedcba9876543210" * 2
+
+
+@pytest.fixture
+def audio_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_formats, "AUDIO_DIR", str(tmp_path))
+    t = np.arange(16000) / 16000
+    samples = (8000 * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+    encode_pcm(samples, 16000, resolve_format("mp3"), str(tmp_path / content_filename("tts", DIGEST, "mp3")))
+    encode_pcm(samples, 16000, resolve_format("mp3"), str(tmp_path / f"tts_{UUID_HEX}.mp3"))
+    (tmp_path / f"tts_{UUID_HEX}.part").write_bytes(b"half")
+    return tmp_path
+
+
+@pytest.fixture
+def client(audio_dir):
+    app = Starlette(routes=[Mount("/audio", AudioFiles(directory=str(audio_dir)))])
+    return TestClient(app)
+
+
+def test_only_sha_marked_names_are_content_addressed():
+    assert digest_from_filename(content_filename("tts", DIGEST, "mp3")) == DIGEST[:32]
+    assert digest_from_filename(f"variant_sha-{DIGEST[:32]}_opus_32.opus") == DIGEST[:32]
+    assert digest_from_filename(f"tts_{UUID_HEX}.mp3") is None
+    assert digest_from_filename(f"tts_{UUID_HEX}.part") is None
+
+
+def test_content_addressed_file_is_immutable_and_revalidates_to_304(client):
+    name = content_filename("tts", DIGEST, "mp3")
+    res = client.get(f"/audio/{name}")
+    assert res.status_code == 200
+    assert res.headers["cache-control"] == IMMUTABLE_CACHE
+    assert res.headers["etag"] == f'"{os.path.splitext(name)[0]}"'
+    assert res.headers["content-type"] == "audio/mpeg"
+
+    again = client.get(f"/audio/{name}", headers={"If-None-Match": res.headers["etag"]})
+    assert again.status_code == 304
+
+
+def test_uuid_named_file_takes_the_revalidate_path(client):
+    res = client.get(f"/audio/tts_{UUID_HEX}.mp3")
+    assert res.status_code == 200
+    assert res.headers["cache-control"] == REVALIDATE_CACHE
+    again = client.get(f"/audio/tts_{UUID_HEX}.mp3", headers={"If-None-Match": res.headers["etag"]})
+    assert again.status_code == 304
+
+
+def test_partial_files_are_not_served(client):
+    assert client.get(f"/audio/tts_{UUID_HEX}.part").status_code == 404
+
+
+def test_range_request_returns_the_slice(client):
+    name = content_filename("tts", DIGEST, "mp3")
+    full = client.get(f"/audio/{name}").content
+    res = client.get(f"/audio/{name}", headers={"Range": "bytes=0-99"})
+    assert res.status_code == 206
+    assert res.content == full[:100]
+
+
+def test_format_query_transcodes_once(client, audio_dir):
+    name = content_filename("tts", DIGEST, "mp3")
+    res = client.get(f"/audio/{name}?format=opus_32")
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "audio/ogg"
+    assert res.headers["cache-control"] == IMMUTABLE_CACHE
+
+    variant = audio_dir / f"variant_sha-{DIGEST[:32]}_opus_32.opus"
+    assert variant.exists()
+    mtime = variant.stat().st_mtime_ns
+    # Second request is a hit on the stored variant
+    assert client.get(f"/audio/{name}?format=opus_32").content == res.content
+    assert variant.stat().st_mtime_ns == mtime
+
+
+def test_unknown_format_is_rejected(client):
+    name = content_filename("tts", DIGEST, "mp3")
+    assert client.get(f"/audio/{name}?format=flac").status_code == 400
@@ -0,0 +1,115 @@
+# All comments in English.
+import importlib
+import sys
+import threading
+import types
+
+import pytest
+
+
+class FakeSummarizer:
+    """Stands in for gemini_service.summarize_history; can hold folds open."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, previous, turns, max_words):
+        self.calls.append([t["user"] for t in turns])
+        self.release.wait(5)
+        return (previous + " " + " ".join(f"[{t['user']}]" for t in turns)).strip()
+
+
+@pytest.fixture
+def summarizer():
+    return FakeSummarizer()
+
+
+@pytest.fixture
+def hm(monkeypatch, summarizer):
+    # gemini_service loads Whisper and BETO at import; only the fold's LLM
+    # call is used here, so a stand-in module provides it
+    fake = types.ModuleType("app.gemini_service")
+    fake.summarize_history = summarizer
+    monkeypatch.setitem(sys.modules, "app.gemini_service", fake)
+    monkeypatch.delitem(sys.modules, "app.history_manager", raising=False)
+    module = importlib.import_module("app.history_manager")
+    yield module
+    sys.modules.pop("app.history_manager", None)
+
+
+def turns(n, words=20):
+    return [
+        {"user": f"u{i} " + "palabra " * words, "agent": f"a{i} " + "respuesta " * words}
+        for i in range(n)
+    ]
+
+
+def wait_for_fold(hm, lead_key):
+    for _ in range(200):
+        with hm._lock:
+            if not hm._summaries[lead_key].running:
+                return
+        threading.Event().wait(0.01)
+    raise AssertionError("fold did not finish")
+
+
+def test_truncate_keeps_the_newest_text(hm):
+    text = "viejo " * 50 + "NUEVO"
+    cut = hm.truncate_to_tokens(text, 5)
+    assert cut.endswith("NUEVO")
+    assert cut.startswith("…")
+    assert len(cut) <= 5 * hm.CHARS_PER_TOKEN
+    assert hm.truncate_to_tokens("corto", 5) == "corto"
+
+
+def test_verbatim_turns_respect_the_budget(hm):
+    history = turns(30)
+    start = hm.recent_start(history)
+    assert 0 < start < len(history) - 1
+    verbatim = "".join(hm.format_turn(t) for t in history[start:])
+    assert hm.estimate_tokens(verbatim) <= hm.HISTORY_TOKEN_BUDGET - hm.HISTORY_SUMMARY_TOKENS
+
+    # Once the older turns are summarized, only the window is sent verbatim
+    hm._summaries["lead"] = hm.RollingSummary(text="resumen", upto=start)
+    text = hm.history_text("lead", history)
+    assert "Resumen de la llamada hasta ahora:\nresumen" in text
+    assert "u29 " in text
+    assert f"u{start - 1} " not in text
+    assert hm.estimate_tokens(text) <= hm.HISTORY_TOKEN_BUDGET + 20  # headers
+
+
+def test_unsummarized_turns_stay_verbatim_until_their_fold_lands(hm):
+    history = turns(30)
+    start = hm.recent_start(history)
+    hm._summaries["lead"] = hm.RollingSummary(text="resumen", upto=start - 3, running=True)
+    text = hm.history_text("lead", history)
+    for i in range(start - 3, len(history)):
+        assert f"u{i} " in text
+    assert f"u{start - 4} " not in text
+
+
+def test_fold_summarizes_overflowed_turns_once_per_lead(hm, summarizer):
+    history = turns(30)
+    start = hm.recent_start(history)
+
+    summarizer.release.clear()
+    hm.schedule_summary("lead", history)
+    hm.schedule_summary("lead", history)  # fold already pending: no second one
+    summarizer.release.set()
+    wait_for_fold(hm, "lead")
+
+    assert summarizer.calls == [[t["user"] for t in history[:start]]]
+    assert hm._summaries["lead"].upto == start
+    # The summary is capped, keeping its newest facts
+    summary = hm._summaries["lead"].text
+    assert hm.estimate_tokens(summary) <= hm.HISTORY_SUMMARY_TOKENS
+    assert f"[u{start - 1} " in summary
+    assert summary in hm.history_text("lead", history)
+
+
+def test_short_calls_need_no_fold(hm, summarizer):
+    hm.schedule_summary("lead", turns(2))
+    assert summarizer.calls == []
+    assert "[Sin mensajes previos]" in hm.history_text("other", [])
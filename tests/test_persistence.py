@@ -0,0 +1,103 @@
+# All comments in English.
+from app.persistence import WriteBehind
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.call = {"table": table}
+
+    def insert(self, rows):
+        self.call.update(op="insert", rows=list(rows))
+        return self
+
+    def update(self, values):
+        self.call.update(op="update", values=values)
+        return self
+
+    def in_(self, column, values):
+        self.call.update(column=column, ids=sorted(values))
+        return self
+
+    def execute(self):
+        if self.call["op"] in self.client.fail_ops:
+            raise RuntimeError("database down")
+        self.client.calls.append(self.call)
+
+
+class FakeClient:
+    """Records the supabase calls WriteBehind makes; ops in fail_ops raise."""
+
+    def __init__(self):
+        self.calls = []
+        self.fail_ops = set()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+def make_writer(client, batch_size=100, max_pending=100):
+    # Long interval and big batches: the test decides when to flush
+    return WriteBehind(client, "ConversationTurn", batch_size, 3600, max_pending)
+
+
+def test_turns_are_one_bulk_insert_and_outcomes_one_update_per_status():
+    client = FakeClient()
+    writer = make_writer(client)
+    for i in range(3):
+        writer.enqueue_turn({"lead_id": "a", "user_text": f"u{i}"})
+    writer.enqueue_outcome("a", "FOLLOW_UP")
+    writer.enqueue_outcome("a", "INTERESTED")  # newer outcome for the same lead wins
+    writer.enqueue_outcome("b", "INTERESTED")
+    writer.enqueue_outcome("c", "CONTACTED")
+
+    assert writer.flush()
+    inserts = [c for c in client.calls if c["op"] == "insert"]
+    updates = [c for c in client.calls if c["op"] == "update"]
+    assert len(inserts) == 1
+    assert [r["user_text"] for r in inserts[0]["rows"]] == ["u0", "u1", "u2"]
+    by_status = {u["values"]["last_call_status"]: u["ids"] for u in updates}
+    assert by_status == {"INTERESTED": ["a", "b"], "CONTACTED": ["c"]}
+    assert writer.stats()["writtenTurns"] == 3
+    assert writer.stats()["writtenOutcomes"] == 3
+
+
+def test_failed_flush_requeues_without_duplicating_written_turns():
+    client = FakeClient()
+    writer = make_writer(client)
+    writer.enqueue_turn({"lead_id": "a", "user_text": "hola"})
+    writer.enqueue_outcome("a", "INTERESTED")
+
+    client.fail_ops = {"update"}
+    assert not writer.flush()
+    assert writer.stats()["pendingTurns"] == 0  # the insert went through
+    assert writer.stats()["pendingOutcomes"] == 1
+    assert writer.stats()["failedFlushes"] == 1
+
+    client.fail_ops = set()
+    assert writer.flush()
+    assert len([c for c in client.calls if c["op"] == "insert"]) == 1
+    assert [c["ids"] for c in client.calls if c["op"] == "update"] == [["a"]]
+
+
+def test_pending_turns_are_bounded():
+    client = FakeClient()
+    writer = make_writer(client, batch_size=100, max_pending=100)
+    client.fail_ops = {"insert"}
+    for i in range(105):
+        writer.enqueue_turn({"user_text": f"u{i}"})
+    assert writer.stats()["droppedTurns"] == 5
+
+    client.fail_ops = set()
+    assert writer.flush()
+    rows = [r for c in client.calls for r in c["rows"]]
+    assert rows[0]["user_text"] == "u5"  # the oldest were dropped
+    assert len(rows) == 100
+
+
+def test_stop_flushes_what_is_left():
+    client = FakeClient()
+    writer = make_writer(client)
+    writer.enqueue_turn({"user_text": "last"})
+    writer.stop(timeout=5)
+    assert [r["user_text"] for c in client.calls for r in c["rows"]] == ["last"]
@@ -0,0 +1,105 @@
+# All comments in English.
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.stt_batching import WhisperBatcher
+
+
+def clip(value: float) -> np.ndarray:
+    return np.full(160, value, dtype=np.float32)
+
+
+class FakeWhisper:
+    """run_batch stand-in: records each batch and tags every clip's result."""
+
+    def __init__(self, delay_s: float = 0.0, gate: threading.Event = None):
+        self.batches = []
+        self.delay_s = delay_s
+        self.gate = gate
+
+    def __call__(self, clips):
+        if self.gate is not None:
+            self.gate.wait(2)
+        time.sleep(self.delay_s)
+        self.batches.append([float(c[0]) for c in clips])
+        return [[{"text": f"clip {c[0]:g}"}] for c in clips]
+
+
+def test_lone_caller_does_not_wait_for_the_window():
+    whisper = FakeWhisper()
+    batcher = WhisperBatcher(whisper, max_batch=8, window_s=5.0)
+
+    t0 = time.monotonic()
+    assert batcher.submit(clip(1)).result(timeout=2) == [{"text": "clip 1"}]
+    assert time.monotonic() - t0 < 1.0
+
+
+def test_clips_of_turns_still_preparing_join_one_batch():
+    whisper = FakeWhisper()
+    batcher = WhisperBatcher(whisper, max_batch=8, window_s=1.0)
+    futures = []
+    all_preparing = threading.Barrier(3)
+
+    def turn(value):
+        with batcher.preparing():
+            all_preparing.wait(2)
+            time.sleep(0.02 * value)  # decoding / VAD of this turn's audio
+            futures.append(batcher.submit(clip(value)))
+
+    threads = [threading.Thread(target=turn, args=(v,)) for v in (1, 2, 3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    results = sorted(f.result(timeout=2)[0]["text"] for f in futures)
+    assert results == ["clip 1", "clip 2", "clip 3"]
+    assert sorted(whisper.batches[0]) == [1.0, 2.0, 3.0]
+    assert batcher.stats()["batches"] == 1
+    assert batcher.stats()["largestBatch"] == 3
+
+
+def test_batch_size_is_capped():
+    gate = threading.Event()
+    whisper = FakeWhisper(gate=gate)
+    batcher = WhisperBatcher(whisper, max_batch=2, window_s=0.0)
+
+    futures = [batcher.submit(clip(v)) for v in (1, 2, 3, 4, 5)]
+    gate.set()
+    for f in futures:
+        f.result(timeout=2)
+    assert max(len(b) for b in whisper.batches) <= 2
+    assert batcher.stats()["clips"] == 5
+
+
+def test_cancelled_clip_is_not_decoded():
+    gate = threading.Event()
+    whisper = FakeWhisper(gate=gate)
+    batcher = WhisperBatcher(whisper, max_batch=1, window_s=0.0)
+
+    running = batcher.submit(clip(1))  # holds the scheduler at the gate
+    queued = batcher.submit(clip(2))
+    time.sleep(0.05)
+    assert queued.cancel()
+
+    gate.set()
+    assert running.result(timeout=2) == [{"text": "clip 1"}]
+    time.sleep(0.05)
+    assert whisper.batches == [[1.0]]
+    assert batcher.stats()["clips"] == 1
+
+
+def test_errors_reach_every_clip_of_the_batch():
+    def broken(clips):
+        raise RuntimeError("whisper failed")
+
+    batcher = WhisperBatcher(broken, max_batch=4, window_s=0.0)
+    fut = batcher.submit(clip(1))
+    with pytest.raises(RuntimeError, match="whisper failed"):
+        fut.result(timeout=2)
+    # The scheduler survives and serves the next clip
+    with pytest.raises(RuntimeError):
+        batcher.submit(clip(2)).result(timeout=2)
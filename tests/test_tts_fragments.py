@@ -0,0 +1,93 @@
+# All comments in English.
+import numpy as np
+import pytest
+
+from app import tts_fragments
+from app.phrases import CANNED_SENTENCES
+from app.tts_fragments import (
+    CROSSFADE_MS,
+    EDGE_PAD_MS,
+    FRAGMENT_RATE,
+    Slot,
+    crossfade_join,
+    fragment_pcm,
+    intro_parts,
+    parts_text,
+    reply_parts,
+    trim_silence,
+)
+
+FADE = FRAGMENT_RATE * CROSSFADE_MS // 1000
+
+
+def test_crossfade_overlaps_each_join():
+    a = np.full(1000, 1000, dtype=np.int16)
+    b = np.full(800, 1000, dtype=np.int16)
+    out = crossfade_join([a, b])
+    assert len(out) == len(a) + len(b) - FADE
+    # Equal-power fade: the overlap never exceeds sqrt(2) x the level
+    assert out.max() <= int(1000 * np.sqrt(2)) + 1
+    assert out[0] == 1000 and out[-1] == 1000
+
+
+def test_crossfade_skips_empty_pieces():
+    a = np.full(500, 10, dtype=np.int16)
+    assert np.array_equal(crossfade_join([np.zeros(0, dtype=np.int16), a]), a)
+    assert len(crossfade_join([])) == 0
+
+
+def test_trim_silence_keeps_only_edge_padding():
+    pad = FRAGMENT_RATE * EDGE_PAD_MS // 1000
+    voice = (8000 * np.sin(np.arange(FRAGMENT_RATE // 2) / 3)).astype(np.int16)
+    silence = np.zeros(FRAGMENT_RATE, dtype=np.int16)
+    trimmed = trim_silence(np.concatenate([silence, voice, silence]))
+    assert len(voice) <= len(trimmed) <= len(voice) + 2 * pad + 2 * 160
+
+
+def test_reply_parts_reuses_a_canned_sentence():
+    plan = CANNED_SENTENCES["plan_intermedia"]
+    reply = "¡Perfecto! " + plan.lower().replace(",", "") + " ¿Te sirve el sábado? Te espero."
+    parts = reply_parts(reply)
+    assert parts == [
+        Slot("¡Perfecto!", cache=False),
+        plan,
+        Slot("¿Te sirve el sábado? Te espero.", cache=False),
+    ]
+
+
+def test_reply_parts_is_none_without_a_canned_sentence():
+    assert reply_parts("Claro, te llamo mañana. ¡Gracias!") is None
+
+
+def test_intro_only_synthesizes_the_name():
+    parts = intro_parts("Ana")
+    assert [p for p in parts if isinstance(p, Slot)] == [Slot("Ana,")]
+    assert parts_text(parts).startswith("Hola Ana, ¿cómo estás?")
+
+
+@pytest.fixture
+def fake_tts(tmp_path, monkeypatch):
+    calls = []
+
+    def synthesize(text):
+        calls.append(text)
+        return b"\x01\x00" * 1600 + b"\x00"  # odd length, as ElevenLabs can send
+
+    monkeypatch.setattr(tts_fragments, "synthesize_pcm", synthesize)
+    monkeypatch.setattr(tts_fragments, "TTS_FRAGMENT_DIR", str(tmp_path))
+    monkeypatch.setattr(tts_fragments, "_cache", type(tts_fragments._cache)())
+    return calls
+
+
+def test_phrases_are_stored_on_disk_and_slots_only_in_memory(fake_tts, tmp_path):
+    phrase = CANNED_SENTENCES["pitch_80"]
+    assert len(fragment_pcm(phrase)) == 1600
+    fragment_pcm("Ana,", persist=False)
+    fragment_pcm("Ana,", persist=False)
+    assert fake_tts == [phrase, "Ana,"]
+    assert len(list(tmp_path.rglob("*.pcm"))) == 1
+
+    # A new process (empty memory) reads the phrase back from disk
+    tts_fragments._cache.clear()
+    fragment_pcm(phrase)
+    assert fake_tts == [phrase, "Ana,"]
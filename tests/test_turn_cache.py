@@ -0,0 +1,97 @@
+# All comments in English.
+import asyncio
+
+import pytest
+
+from app import turn_cache as turn_cache_module
+from app.turn_cache import TurnCache, turn_key
+from app.turn_control import TurnCancelled
+
+REPLY = {"type": "reply", "replyText": "hola"}
+
+
+def test_turn_key_depends_on_scope_and_bytes():
+    assert turn_key("lead", b"abc") == turn_key("lead", b"abc")
+    assert turn_key("lead", b"abc") != turn_key("lead", b"abd")
+    assert turn_key("lead", b"abc") != turn_key("other", b"abc")
+
+
+def test_retry_joins_the_turn_in_flight():
+    async def scenario():
+        cache = TurnCache(ttl_s=60, max_entries=10)
+        key = turn_key("lead", b"audio")
+        assert cache.inflight(key) is None
+
+        cache.begin(key)
+        pending = cache.inflight(key)
+        assert pending is not None and not pending.done()
+
+        cache.finish(key, REPLY)
+        assert await pending == REPLY
+        assert cache.inflight(key) is None
+        assert cache.get(key) == REPLY
+        assert cache.stats()["joined"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_failed_turn_reaches_waiters_and_is_not_cached():
+    async def scenario():
+        cache = TurnCache(ttl_s=60, max_entries=10)
+        key = turn_key("lead", b"audio")
+        cache.begin(key)
+        pending = cache.inflight(key)
+
+        cache.fail(key, asyncio.CancelledError())
+        with pytest.raises(TurnCancelled):
+            await pending
+        assert cache.get(key) is None
+        assert cache.stats()["inflight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_fail_after_finish_is_a_no_op():
+    async def scenario():
+        cache = TurnCache(ttl_s=60, max_entries=10)
+        key = turn_key("lead", b"audio")
+        cache.begin(key)
+        cache.finish(key, REPLY)
+        cache.fail(key, RuntimeError("late"))
+        assert cache.get(key) == REPLY
+
+    asyncio.run(scenario())
+
+
+def test_replies_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(turn_cache_module.time, "monotonic", lambda: now[0])
+
+    async def scenario():
+        cache = TurnCache(ttl_s=5, max_entries=10)
+        key = turn_key("lead", b"audio")
+        cache.begin(key)
+        cache.finish(key, REPLY)
+
+        now[0] += 4.9
+        assert cache.get(key) == REPLY
+        now[0] += 0.2
+        assert cache.get(key) is None
+        assert cache.stats()["cached"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_oldest_replies_are_evicted_beyond_max_entries():
+    async def scenario():
+        cache = TurnCache(ttl_s=60, max_entries=2)
+        keys = [turn_key("lead", bytes([i])) for i in range(3)]
+        for i, key in enumerate(keys):
+            cache.begin(key)
+            cache.finish(key, {"n": i})
+
+        assert cache.get(keys[0]) is None
+        assert cache.get(keys[1]) == {"n": 1}
+        assert cache.get(keys[2]) == {"n": 2}
+
+    asyncio.run(scenario())
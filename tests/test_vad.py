@@ -0,0 +1,49 @@
+# All comments in English.
+import numpy as np
+
+from app.vad import PAD_MS, SAMPLE_RATE, voiced_span
+
+rng = np.random.default_rng(0)
+
+
+def tone(seconds: float, amplitude: float = 0.3, hz: float = 220.0) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * hz * t)).astype(np.float32)
+
+
+def quiet(seconds: float, level: float = 0.001) -> np.ndarray:
+    return (level * rng.standard_normal(int(seconds * SAMPLE_RATE))).astype(np.float32)
+
+
+def test_silence_is_none():
+    assert voiced_span(np.zeros(SAMPLE_RATE, dtype=np.float32)) is None
+    assert voiced_span(quiet(1.0)) is None
+
+
+def test_too_short_input_is_none():
+    assert voiced_span(np.zeros(10, dtype=np.float32)) is None
+
+
+def test_a_click_is_not_speech():
+    audio = quiet(1.0)
+    audio[8000:8000 + 480] = 0.5  # one 30 ms bump
+    assert voiced_span(audio) is None
+
+
+def test_span_covers_speech_plus_padding():
+    audio = np.concatenate([quiet(1.0), tone(0.5), quiet(1.0)])
+    span = voiced_span(audio)
+    assert span is not None
+    start, end = span
+    pad = SAMPLE_RATE * PAD_MS // 1000
+    speech_start, speech_end = SAMPLE_RATE, int(1.5 * SAMPLE_RATE)
+    # Frame-aligned, so allow one frame of slack on top of the padding
+    assert speech_start - pad - 480 <= start <= speech_start - pad + 480
+    assert speech_end + pad - 480 <= end <= speech_end + pad + 480
+
+
+def test_hiss_is_not_speech():
+    # Loud white noise crosses zero on almost every sample
+    audio = np.concatenate([quiet(0.5), 0.3 * rng.standard_normal(SAMPLE_RATE).astype(np.float32)])
+    audio = np.clip(audio, -1, 1)
+    assert voiced_span(audio) is None